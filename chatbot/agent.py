@@ -7,19 +7,140 @@ from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List, Union
 from agent_tools import get_current_weather, get_safest_routes, get_location_mapbox,query_disaster_data
+from agent_tools import aget_current_weather, aget_safest_routes, aget_location_mapbox, aquery_disaster_data
+from agent_tools import query_disasters_spatial, aquery_disasters_spatial
+from agent_tools import find_nearest_shelter, afind_nearest_shelter
+from agent_tools import safest_routes_tool, asafest_routes_tool
 import datetime
 import json
 import re
 import os
 from dotenv import load_dotenv
 
+# Load environment variables from .env file
+load_dotenv()
+
 class AgentResponse(BaseModel):
     output: str = Field(description="Natural language response from the agent.")
     image: Optional[str] = Field(default=None, description="URL of any image required.")
     geometryCode: Optional[str] = Field(default=None, description="Encoded geometry data.")
     locationCoordinates: Optional[Dict[str, str]] = Field(default=None, description="Coordinates in the format {'latitude': '', 'longitude': ''}.")
 
+def parse_agent_output(raw_output: str) -> Dict[str, Any]:
+    # Try to parse it as JSON directly
+    try:
+        # Find JSON in output (in case there's text around it)
+
+        json_match = re.search(r'({.*})', raw_output.replace('\n', ''))
+        if json_match:
+            json_str = json_match.group(1)
+            json_obj = json.loads(json_str)
+            return json_obj
+        else:
+            # Fall back to parsing the entire output
+            return json.loads(raw_output)
+    except json.JSONDecodeError:
+        # If parsing fails, return raw output in our format
+        return {
+            "output": raw_output,
+            "image": None,
+            "geometryCode": None,
+            "locationCoordinates":None
+        }
+
+# Simple wrapper to ensure we get the raw JSON
+class DirectJsonExecutor(AgentExecutor):
+    def invoke(self, input: Union[Dict[str, Any], str], config: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        # Call the original executor, per-request callbacks come in through config
+        result = super().invoke(input, config, **kwargs)
+        return parse_agent_output(result.get("output", ""))
+
+    async def ainvoke(self, input: Union[Dict[str, Any], str], config: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        # Same on the event loop: the LLM calls and the tools' coroutines are awaited
+        result = await super().ainvoke(input, config, **kwargs)
+        return parse_agent_output(result.get("output", ""))
+
+
+class OutputFieldStreamer:
+    # Incremental reader of the "output" string of the JSON answer while the model is still writing it,
+    # returns the newly decoded characters for every chunk fed. A plain text answer is passed through as is.
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None
+        self.plain = False
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.plain:
+            return chunk
+        if self.pos is None:
+            stripped = self.buffer.lstrip()
+            if stripped and not stripped.startswith(("{", "`")):
+                self.plain = True
+                return self.buffer
+            match = re.search(r'"output"\s*:\s*"', self.buffer)
+            if not match:
+                return ""
+            self.pos = match.end()
+        text = []
+        while self.pos < len(self.buffer):
+            c = self.buffer[self.pos]
+            if c == '"':
+                self.done = True
+                break
+            if c == "\\":
+                escape = self.buffer[self.pos:self.pos + 6] if self.buffer[self.pos + 1:self.pos + 2] == "u" else self.buffer[self.pos:self.pos + 2]
+                if len(escape) < 2 or (escape[1] == "u" and len(escape) < 6):
+                    # wait for the rest of the escape sequence
+                    break
+                text.append(json.loads('"' + escape + '"'))
+                self.pos += len(escape)
+                continue
+            text.append(c)
+            self.pos += 1
+        return "".join(text)
+
+
+async def astream_agent(agent_executor: AgentExecutor, input: Dict[str, Any], config: Optional[Dict[str, Any]] = None):
+    """
+    Runs the agent and yields (event, data) pairs as it goes:
+    - ("tool_start", {"tool", "input"}) / ("tool_end", {"tool"}) around every tool call
+    - ("token", {"text"}) for every new piece of the answer's "output" text
+    - ("final", {...}) once at the end, with the same fields as the /response answer
+    """
+    streamer = OutputFieldStreamer()
+    async for event in agent_executor.astream_events(input, config=config, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            # only the last model turn is the answer, earlier ones decide on tool calls
+            streamer = OutputFieldStreamer()
+        elif kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if isinstance(content, str) and content:
+                text = streamer.feed(content)
+                if text:
+                    yield "token", {"text": text}
+        elif kind == "on_tool_start":
+            yield "tool_start", {"tool": event["name"], "input": str(event["data"].get("input", ""))}
+        elif kind == "on_tool_end":
+            yield "tool_end", {"tool": event["name"]}
+
+    response = parse_agent_output(streamer.buffer)
+    yield "final", {
+        "output": response.get("output", ""),
+        "geometryCODE": response.get("geometryCode", ""),
+        "imageURL": response.get("image", ""),
+        "locationCoordinates": response.get("locationCoordinates", {})
+    }
+
+
 def initialize_agent_executor():
+    # Builds the tools, LLM client, prompt and executor. Meant to be called once per process (see
+    # main_api's lifespan), the executor holds no per-request state: history and callbacks are passed
+    # to every invoke.
     try:
         # Define tools
         def get_time():
@@ -29,43 +150,64 @@ def initialize_agent_executor():
             num1, num2 = map(float, input.split(","))
             return str(num1 + num2)
 
+        async def aget_time():
+            return get_time()
+
+        async def aadd_numbers(input: str):
+            return add_numbers(input)
+
         tools = [
             Tool(
                 name="get_time",
                 func=lambda _: get_time(),
+                coroutine=lambda _: aget_time(),
                 description="Returns the current time in HH:MM:SS format."
             ),
             Tool(
                 name="add_numbers",
                 func=add_numbers,
+                coroutine=aadd_numbers,
                 description="Adds two numbers. Input format: 'num1,num2'."
             ),
             Tool(
                 name="get_weather",
                 func=lambda input: get_current_weather(input),
+                coroutine=lambda input: aget_current_weather(input),
                 description="Gets current weather for a location. Input can be a city name or coordinates as 'latitude,longitude'. Optional second parameter for unit format ('celsius' or 'fahrenheit')."
             ),
             Tool(
                 name="get_safest_routes",
-                func=lambda input: get_safest_routes(*input.split(",")),
-                description="Gets the safest routes between two locations. Input format: 'startLocation,endLocation'."
+                func=safest_routes_tool,
+                coroutine=asafest_routes_tool,
+                description="Gets the safest route between two locations: the driving alternative least exposed to reported disaster zones, with the hazards it passes and the other alternatives. Input format: 'startLocation;endLocation', each a place name or 'latitude,longitude'."
             ),
             Tool(
                 name="get_location",
                 func=lambda input: get_location_mapbox(input),
+                coroutine=lambda input: aget_location_mapbox(input),
                 description="Gets the latitude and longitude for a given place name. Input format: 'placeName'."
             ),
             Tool(
                 name="query_disasters",
                 func=lambda input: query_disaster_data(input),
+                coroutine=lambda input: aquery_disaster_data(input),
                 description="Queries disaster data from the disaster.json file. Supports queries like: 'all disasters', 'disaster in [location]', 'disaster of type [type]', 'disaster with [damage_level]', 'recent disasters'."
+            ),
+            Tool(
+                name="query_disasters_nearby",
+                func=lambda input: query_disasters_spatial(input),
+                coroutine=lambda input: aquery_disasters_spatial(input),
+                description="Finds disasters by position, with distances in km. Input format: 'near latitude,longitude,radius_km' for reports within a radius, 'nearest latitude,longitude,k' for the k closest reports, or 'bbox min_lat,min_lon,max_lat,max_lon' for a bounding box. Use get_location first to turn a place name into coordinates."
+            ),
+            Tool(
+                name="find_nearest_shelter",
+                func=lambda input: find_nearest_shelter(input),
+                coroutine=lambda input: afind_nearest_shelter(input),
+                description="Finds the nearest open shelter or evacuation point by road, with the travel time in minutes, the distance in km and whether the way there crosses a disaster zone. Input format: 'placeName' or 'latitude,longitude'."
             )
         ]
 
         # Initialize LLM with OpenAI API
-        # Load environment variables from .env file
-        load_dotenv()
-        
         llm = ChatOpenAI(
             model="gpt-4o-mini",
             temperature=0,
@@ -100,36 +242,6 @@ def initialize_agent_executor():
         agent = create_tool_calling_agent(llm, tools, prompt)
 
         
-        # Simple wrapper to ensure we get the raw JSON
-        class DirectJsonExecutor(AgentExecutor):
-            def invoke(self, input: Union[Dict[str, Any], str]) -> Dict[str, Any]:
-                # Call the original executor
-                result = super().invoke(input)
-                
-                # Get raw output
-                raw_output = result.get("output", "")
-                
-                # Try to parse it as JSON directly
-                try:
-                    # Find JSON in output (in case there's text around it)
-
-                    json_match = re.search(r'({.*})', raw_output.replace('\n', ''))
-                    if json_match:
-                        json_str = json_match.group(1)
-                        json_obj = json.loads(json_str)
-                        return json_obj
-                    else:
-                        # Fall back to parsing the entire output
-                        return json.loads(raw_output)
-                except json.JSONDecodeError:
-                    # If parsing fails, return raw output in our format
-                    return {
-                        "output": raw_output,
-                        "image": None,
-                        "geometryCode": None,
-                        "locationCoordinates":None
-                    }
-
         # Initialize DirectJsonExecutor
         agent_executor = DirectJsonExecutor(agent=agent, tools=tools, verbose=True)
 
@@ -1,9 +1,36 @@
-import requests
+import http_client
+from geocode_cache import get_geocode_cache
+from disaster_store import DisasterStore
+from route_hazards import rank_routes
+from road_graph import get_road_graph
+from shelter_fields import ShelterFields
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional,List
 from pydantic import BaseModel
 import os 
 import json
 
+# "mapbox" (Directions API), "local" (road graph on disk, see road_graph.py) or "auto" (Mapbox, the local graph when it fails).
+# Places given as "LAT,LON" are never geocoded; in local mode the others come from the geocoding cache only
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "mapbox")
+
+# API keys of the upstreams, the same ones for the blocking and the async tools
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "openweathermap_api_key")
+MAPBOX_GEOCODING_TOKEN = os.getenv("MAPBOX_GEOCODING_TOKEN", "pk.eyJ1IjoibW91YWRlbm5hIiwiYSI6ImNseDB1d2VuczA0Y3gyaXM0Y2E5Z3A2OWoifQ.nnDPc-c8ndn7lpfEqukeXA")
+MAPBOX_DIRECTIONS_TOKEN = os.getenv("MAPBOX_DIRECTIONS_TOKEN", "pk.eyJ1IjoibW91YWRlbm5hIiwiYSI6ImNseDB1dTlzMTA0ZHAyanF4bHpkcXN1ZWYifQ.LZPFuOLYykPmI3es9aKyig")
+
+# At most this many reports are returned by a spatial query, the total count is always given
+SPATIAL_RESULT_LIMIT = int(os.getenv("SPATIAL_RESULT_LIMIT", "20"))
+
+# Bounded pool for the work that has no async version (file reads), so it never blocks the event loop
+blocking_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tools")
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_pool, func, *args)
+
 class WeatherResponse(BaseModel):
     location: str
     temperature: float
@@ -14,77 +41,156 @@ class SafestRouteResponse(BaseModel):
     distance: float
     duration: float
     geometry: str
+    exposure_km: float = 0.0
+    weighted_exposure: float = 0.0
+    hazards: List[Dict[str, Any]] = []
+    affected_segments: List[List[int]] = []
+    alternatives: List[Dict[str, Any]] = []
+    backend: str = "mapbox"
 
 class LocationResponse(BaseModel):
     place_name: str
     latitude: float
     longitude: float
 
-def get_current_weather(location: str, format: str = "celsius") -> Dict[str, Any]:
-    api_key = "openweathermap_api_key"
+# Request building and response parsing shared by the blocking tools and their async versions
+
+def _weather_request(location: str, format: str) -> tuple:
     base_url = "http://api.openweathermap.org/data/2.5/weather"
-    params = {"appid": api_key, "units": "metric" if format.lower() == "celsius" else "imperial"}
+    params = {"appid": OPENWEATHER_API_KEY, "units": "metric" if format.lower() == "celsius" else "imperial"}
 
     if "," in location:
         latitude, longitude = map(float, location.split(","))
         params["lat"], params["lon"] = latitude, longitude
     else:
         params["q"] = location
+    return base_url, params
 
-    try:
-        response = requests.get(base_url, params=params)
-        data = response.json()
-        return WeatherResponse(
-            location=data.get("name", "Unknown"),
-            temperature=data["main"]["temp"],
-            description=data["weather"][0]["description"],
-            unit=format
+def _weather_result(data: Dict[str, Any], format: str) -> Dict[str, Any]:
+    return WeatherResponse(
+        location=data.get("name", "Unknown"),
+        temperature=data["main"]["temp"],
+        description=data["weather"][0]["description"],
+        unit=format
+    ).model_dump()
+
+def _geocode_url(place_name: str) -> str:
+    return f"https://api.mapbox.com/geocoding/v5/mapbox.places/{place_name}.json?access_token={MAPBOX_GEOCODING_TOKEN}"
+
+def _geocode_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    if data["features"]:
+        place = data["features"][0]
+        return LocationResponse(
+            place_name=place["place_name"],
+            latitude=place["center"][1],
+            longitude=place["center"][0]
         ).model_dump()
+    return {"error": "Location not found"}
+
+def _directions_result(response) -> List[Dict[str, Any]]:
+    # an HTTP error (rate limit, 5xx) or an error body without routes raises, so auto mode can fall back
+    if not 200 <= response.status_code < 300:
+        raise ValueError(f"Mapbox Directions returned HTTP {response.status_code}")
+    data = response.json()
+    if "routes" not in data:
+        raise ValueError(data.get("message", "Mapbox Directions returned no routes"))
+    return data["routes"]
+
+def _point_location(place_name: str) -> Optional[Dict[str, Any]]:
+    # "LAT,LON" needs no geocoding
+    point = _parse_point(place_name)
+    if point is None:
+        return None
+    return LocationResponse(place_name=place_name, latitude=point[0], longitude=point[1]).model_dump()
+
+def _cached_location(place_name: str) -> Dict[str, Any]:
+    # local mode never calls Mapbox: places are only resolved from the geocoding cache
+    cached = get_geocode_cache().get(place_name)
+    if cached is None:
+        return {"error": f"{place_name} is not in the geocoding cache, give it as LAT,LON to route offline"}
+    return dict(cached)
+
+# overview=full: the simplified default geometry cuts corners through or around the hazard buffers
+def _directions_url(start_location: Dict[str, Any], end_location: Dict[str, Any]) -> str:
+    return f"https://api.mapbox.com/directions/v5/mapbox/driving/{start_location['longitude']},{start_location['latitude']};{end_location['longitude']},{end_location['latitude']}?alternatives=true&overview=full&access_token={MAPBOX_DIRECTIONS_TOKEN}"
+
+def get_current_weather(location: str, format: str = "celsius") -> Dict[str, Any]:
+    try:
+        base_url, params = _weather_request(location, format)
+        response = http_client.get(base_url, params=params)
+        return _weather_result(response.json(), format)
     except Exception as error:
         return {"error": str(error)}
 
+def _safest_route(routes: List[Dict[str, Any]], backend: str = "mapbox") -> Dict[str, Any]:
+    # alternatives ranked by how much of them runs through buffered disaster zones; the least exposed
+    # one is returned in the usual fields, the others are summarized under alternatives
+    ranked = rank_routes(routes, get_disaster_store())
+    best = ranked[0]
+    alternatives = [
+        {key: r[key] for key in ("distance", "duration", "exposure_km", "weighted_exposure")}
+        for r in ranked[1:]
+    ]
+    return SafestRouteResponse(**best, alternatives=alternatives, backend=backend).model_dump()
+
+def _local_safest_route(start_location: Dict[str, Any], end_location: Dict[str, Any]) -> Dict[str, Any]:
+    # routed on the local graph with the current disaster zones as edge penalties, no network needed
+    graph = get_road_graph()
+    graph.refresh(get_disaster_store())
+    routes = graph.routes(start_location["latitude"], start_location["longitude"], end_location["latitude"], end_location["longitude"])
+    if routes:
+        return _safest_route(routes, backend="local")
+    return {"error": "No routes found"}
+
+def _locate(place_name: str) -> Dict[str, Any]:
+    point = _point_location(place_name)
+    if point is not None:
+        return point
+    if ROUTING_BACKEND == "local":
+        return _cached_location(place_name)
+    return get_location_mapbox(place_name)
+
 def get_safest_routes(start_place_name: str, end_place_name: str) -> Dict[str, Any]:
     try:
-        start_location = get_location_mapbox(start_place_name)
+        start_location = _locate(start_place_name)
         if "error" in start_location:
             return {"error": start_location["error"]}
 
-        end_location = get_location_mapbox(end_place_name)
+        end_location = _locate(end_place_name)
         if "error" in end_location:
             return {"error": end_location["error"]}
 
-        api_key = "pk.eyJ1IjoibW91YWRlbm5hIiwiYSI6ImNseDB1dTlzMTA0ZHAyanF4bHpkcXN1ZWYifQ.LZPFuOLYykPmI3es9aKyig"
-        url = f"https://api.mapbox.com/directions/v5/mapbox/driving/{start_location['longitude']},{start_location['latitude']};{end_location['longitude']},{end_location['latitude']}?access_token={api_key}"
-        #url = f"https://api.mapbox.com/directions/v5/mapbox/driving/{start_location['longitude']},{start_location['latitude']};{end_location['longitude']},{end_location['latitude']}?geometries=geojson&access_token={api_key}"
-
-        response = requests.get(url)
-        data = response.json()
-        if data["routes"]:
-            route = data["routes"][0]
-            return SafestRouteResponse(
-                distance=route["distance"],
-                duration=route["duration"],
-                geometry=route["geometry"]
-            ).dict()
+        if ROUTING_BACKEND == "local":
+            return _local_safest_route(start_location, end_location)
+
+        url = _directions_url(start_location, end_location)
+
+        try:
+            routes = _directions_result(http_client.get(url))
+        except Exception:
+            if ROUTING_BACKEND != "auto":
+                raise
+            return _local_safest_route(start_location, end_location)
+        if routes:
+            return _safest_route(routes)
         return {"error": "No routes found"}
     except Exception as error:
         return {"error": str(error)}
 
 def get_location_mapbox(place_name: str) -> Dict[str, Any]:
-    api_key = "pk.eyJ1IjoibW91YWRlbm5hIiwiYSI6ImNseDB1d2VuczA0Y3gyaXM0Y2E5Z3A2OWoifQ.nnDPc-c8ndn7lpfEqukeXA"
-    url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{place_name}.json?access_token={api_key}"
+    # served from the geocoding cache when possible, Mapbox is only asked on a miss
+    cache = get_geocode_cache()
+    cached = cache.get(place_name)
+    if cached is not None:
+        return dict(cached)
+    result = _geocode_mapbox(place_name)
+    cache.put(place_name, result)
+    return result
 
+def _geocode_mapbox(place_name: str) -> Dict[str, Any]:
     try:
-        response = requests.get(url)
-        data = response.json()
-        if data["features"]:
-            place = data["features"][0]
-            return LocationResponse(
-                place_name=place["place_name"],
-                latitude=place["center"][1],
-                longitude=place["center"][0]
-            ).dict()
-        return {"error": "Location not found"}
+        response = http_client.get(_geocode_url(place_name))
+        return _geocode_result(response.json())
     except Exception as error:
         return {"error": str(error)}
     
@@ -97,6 +203,35 @@ class DisasterInfo(BaseModel):
     damage_level: str
     image_url: Optional[str]
 
+def _disaster_row(disaster: Dict[str, Any]) -> Dict[str, Any]:
+    # Convert to DisasterInfo models for consistent output, done once per report when the file is loaded
+    return DisasterInfo(
+        type=disaster["type"],
+        location={
+            "latitude": str(disaster["location"]["latitude"]),
+            "longitude": str(disaster["location"]["longitude"]),
+            "city": disaster["location"]["city"],
+            "region": disaster["location"]["region"],
+            "country": disaster["location"]["country"]
+        },
+        timestamp=disaster["timestamp"],
+        damage_types=disaster["damage_types"],
+        damage_level=disaster["damage_level"],
+        image_url=disaster.get("image_url")
+    ).model_dump()
+
+_disaster_store: Optional[DisasterStore] = None
+# one lock for the lazily built singletons below, so concurrent first calls share one instance
+_singletons_lock = threading.RLock()
+
+def get_disaster_store() -> DisasterStore:
+    global _disaster_store
+    if _disaster_store is None:
+        with _singletons_lock:
+            if _disaster_store is None:
+                _disaster_store = DisasterStore(os.path.join('disasters.json'), _disaster_row)
+    return _disaster_store
+
 def query_disaster_data(query: str) -> Dict[str, Any]:
     """
     Query disaster data from the disaster.json file.
@@ -105,79 +240,187 @@ def query_disaster_data(query: str) -> Dict[str, Any]:
     - "disaster of type [type]" - filter by disaster type (earthquake, flood, etc.)
     - "disaster with [damage_level]" - filter by damage level
     - "recent disasters" - sorts by recency
+    The file is parsed and indexed once and reloaded when it changes (see disaster_store.py).
     """
     try:
-        # Get the absolute path to the disaster.json file
-        # current_dir = os.path.dirname(os.path.abspath(__file__))
-        json_path = os.path.join('disasters.json')
-        
-        # Load the disaster data
-        with open(json_path, 'r') as file:
-            data = json.load(file)
-            all_disasters = data.get("disaster_reports", [])
-        
-        # Process the query to filter the disasters
-        query = query.lower()
-        filtered_disasters = all_disasters
-        
-        # Filter by location
-        if "in " in query:
-            location = query.split("in ")[1].strip()
-            filtered_disasters = [
-                d for d in filtered_disasters if 
-                location in d["location"]["city"].lower() or
-                location in d["location"]["region"].lower() or
-                location in d["location"]["country"].lower()
-            ]
-        
-        # Filter by type
-        if "type " in query:
-            disaster_type = query.split("type ")[1].strip()
-            filtered_disasters = [
-                d for d in filtered_disasters if 
-                disaster_type in d["type"].lower()
-            ]
-        
-        # Filter by damage level
-        if "with " in query:
-            damage_level = query.split("with ")[1].strip()
-            filtered_disasters = [
-                d for d in filtered_disasters if 
-                damage_level in d["damage_level"].lower()
-            ]
-        
-        # Sort by recency
-        if "recent" in query:
-            filtered_disasters = sorted(
-                filtered_disasters, 
-                key=lambda x: x["timestamp"], 
-                reverse=True
-            )
-        
-        # Convert to DisasterInfo models for consistent output
-        result = []
-        for disaster in filtered_disasters:
-            result.append(DisasterInfo(
-                type=disaster["type"],
-                location={
-                    "latitude": str(disaster["location"]["latitude"]),
-                    "longitude": str(disaster["location"]["longitude"]),
-                    "city": disaster["location"]["city"],
-                    "region": disaster["location"]["region"],
-                    "country": disaster["location"]["country"]
-                },
-                timestamp=disaster["timestamp"],
-                damage_types=disaster["damage_types"],
-                damage_level=disaster["damage_level"],
-                image_url=disaster.get("image_url")
-            ).dict())
-        
-        return {
-            "count": len(result),
-            "disasters": result
-        }
+        return get_disaster_store().query(query)
+    except Exception as error:
+        return {"error": str(error), "details": "Failed to query disaster data"}
     
+def query_disasters_spatial(query: str) -> Dict[str, Any]:
+    """
+    Spatial queries over the disaster reports:
+    - "near LAT,LON,RADIUS_KM" - reports within RADIUS_KM of the point, nearest first
+    - "nearest LAT,LON,K" - the K reports closest to the point (K at most SPATIAL_RESULT_LIMIT)
+    - "bbox MIN_LAT,MIN_LON,MAX_LAT,MAX_LON" - reports inside the box, MIN_LON > MAX_LON crosses the antimeridian
+    count is the number of matching reports, disasters holds at most SPATIAL_RESULT_LIMIT of them
+    (the nearest ones for near, the most recent ones for bbox).
+    """
+    try:
+        mode, _, args = query.strip().partition(" ")
+        values = [float(v) for v in args.replace(" ", "").split(",")]
+        store = get_disaster_store()
+        mode = mode.lower()
+        if mode == "near" and len(values) == 3:
+            return store.near(*values, limit=SPATIAL_RESULT_LIMIT)
+        if mode == "nearest" and len(values) == 3:
+            return store.nearest(values[0], values[1], min(int(values[2]), SPATIAL_RESULT_LIMIT))
+        if mode == "bbox" and len(values) == 4:
+            return store.in_bbox(*values, limit=SPATIAL_RESULT_LIMIT)
+        return {"error": "Expected 'near LAT,LON,RADIUS_KM', 'nearest LAT,LON,K' or 'bbox MIN_LAT,MIN_LON,MAX_LAT,MAX_LON'"}
     except Exception as error:
         return {"error": str(error), "details": "Failed to query disaster data"}
     
-#print(query_disaster_data("disaster in Marrakech"))
\ No newline at end of file
+_shelter_fields: Optional[ShelterFields] = None
+
+def get_shelter_fields() -> ShelterFields:
+    global _shelter_fields
+    if _shelter_fields is None:
+        with _singletons_lock:
+            if _shelter_fields is None:
+                _shelter_fields = ShelterFields(get_road_graph(), store=get_disaster_store())
+    return _shelter_fields
+
+def _parse_point(text: str) -> Optional[tuple]:
+    parts = text.replace(" ", "").split(",")
+    try:
+        return (float(parts[0]), float(parts[1])) if len(parts) == 2 else None
+    except ValueError:
+        return None
+
+def split_route_input(text: str) -> tuple:
+    """
+    Tool input of get_safest_routes -> (start, end). Ends are separated by ";" or " to ", so either can be
+    "LAT,LON"; "LAT,LON,LAT,LON" and the older "start,end" are accepted too. Raises ValueError otherwise.
+    """
+    for separator in (";", " to "):
+        if separator in text:
+            parts = [part.strip() for part in text.split(separator)]
+            break
+    else:
+        parts = [part.strip() for part in text.split(",")]
+        if len(parts) == 4:
+            try:
+                [float(part) for part in parts]
+                parts = [f"{parts[0]},{parts[1]}", f"{parts[2]},{parts[3]}"]
+            except ValueError:
+                pass
+    if len(parts) != 2 or not all(parts):
+        raise ValueError("Expected 'startLocation;endLocation', each a place name or 'latitude,longitude'")
+    return parts[0], parts[1]
+
+def safest_routes_tool(input: str) -> Dict[str, Any]:
+    # agent tool wrapper: a malformed input is answered like any other tool error
+    try:
+        start, end = split_route_input(input)
+    except ValueError as error:
+        return {"error": str(error)}
+    return get_safest_routes(start, end)
+
+def find_nearest_shelter(location: str) -> Dict[str, Any]:
+    """
+    Nearest open shelter or evacuation point by road from a place name or "LAT,LON", read from the
+    precomputed shelter fields (see shelter_fields.py) instead of routing to every candidate.
+    """
+    try:
+        point = _parse_point(location)
+        if point is None:
+            place = get_location_mapbox(location)
+            if "error" in place:
+                return {"error": place["error"]}
+            point = (place["latitude"], place["longitude"])
+        return get_shelter_fields().nearest(*point)
+    except Exception as error:
+        return {"error": str(error), "details": "Failed to find a shelter"}
+
+#print(query_disaster_data("disaster in Marrakech"))
+
+
+# Async versions of the tools for the event loop, same inputs and outputs as the blocking ones above
+
+async def aget_current_weather(location: str, format: str = "celsius") -> Dict[str, Any]:
+    try:
+        base_url, params = _weather_request(location, format)
+        response = await http_client.aget(base_url, params=params)
+        return _weather_result(response.json(), format)
+    except Exception as error:
+        return {"error": str(error)}
+
+async def aget_location_mapbox(place_name: str) -> Dict[str, Any]:
+    # the cache's SQLite tier reads and commits to disk under a lock, so it is used off the event loop
+    cache = get_geocode_cache()
+    cached = await run_blocking(cache.get, place_name)
+    if cached is not None:
+        return dict(cached)
+    result = await _ageocode_mapbox(place_name)
+    await run_blocking(cache.put, place_name, result)
+    return result
+
+async def _ageocode_mapbox(place_name: str) -> Dict[str, Any]:
+    try:
+        response = await http_client.aget(_geocode_url(place_name))
+        return _geocode_result(response.json())
+    except Exception as error:
+        return {"error": str(error)}
+
+async def _alocate(place_name: str) -> Dict[str, Any]:
+    point = _point_location(place_name)
+    if point is not None:
+        return point
+    if ROUTING_BACKEND == "local":
+        return await run_blocking(_cached_location, place_name)
+    return await aget_location_mapbox(place_name)
+
+async def aget_safest_routes(start_place_name: str, end_place_name: str) -> Dict[str, Any]:
+    try:
+        # both ends are geocoded concurrently
+        start_location, end_location = await asyncio.gather(
+            _alocate(start_place_name),
+            _alocate(end_place_name)
+        )
+        if "error" in start_location:
+            return {"error": start_location["error"]}
+        if "error" in end_location:
+            return {"error": end_location["error"]}
+
+        if ROUTING_BACKEND == "local":
+            return await run_blocking(_local_safest_route, start_location, end_location)
+
+        url = _directions_url(start_location, end_location)
+
+        try:
+            routes = _directions_result(await http_client.aget(url))
+        except Exception:
+            if ROUTING_BACKEND != "auto":
+                raise
+            return await run_blocking(_local_safest_route, start_location, end_location)
+        if routes:
+            # decoding and scoring the alternatives is CPU work, kept off the event loop
+            return await run_blocking(_safest_route, routes)
+        return {"error": "No routes found"}
+    except Exception as error:
+        return {"error": str(error)}
+
+async def asafest_routes_tool(input: str) -> Dict[str, Any]:
+    try:
+        start, end = split_route_input(input)
+    except ValueError as error:
+        return {"error": str(error)}
+    return await aget_safest_routes(start, end)
+
+async def afind_nearest_shelter(location: str) -> Dict[str, Any]:
+    point = _parse_point(location)
+    if point is None:
+        place = await aget_location_mapbox(location)
+        if "error" in place:
+            return {"error": place["error"]}
+        location = f"{place['latitude']},{place['longitude']}"
+    # a refresh may have to re-run part of the search, so the lookup stays off the event loop
+    return await run_blocking(find_nearest_shelter, location)
+
+async def aquery_disaster_data(query: str) -> Dict[str, Any]:
+    # index lookups only, but a reload parses the file, so it stays off the event loop
+    return await run_blocking(query_disaster_data, query)
+
+async def aquery_disasters_spatial(query: str) -> Dict[str, Any]:
+    return await run_blocking(query_disasters_spatial, query)
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Any, List, Callable, Optional
+
+from spatial_index import GridIndex
+
+# How often at most the file's mtime is checked, in seconds
+RELOAD_CHECK_INTERVAL = float(os.getenv("DISASTERS_RELOAD_CHECK_INTERVAL", "1"))
+
+INDEXED_FIELDS = ["type", "city", "region", "country", "damage_level"]
+
+
+def _field(report: Dict[str, Any], name: str) -> str:
+    if name in ("city", "region", "country"):
+        return report["location"][name]
+    return report[name]
+
+
+def _copy_row(row: Dict[str, Any], **extra) -> Dict[str, Any]:
+    # rows are shared by every request of a snapshot, callers get their own copy (nested location/lists too)
+    copied = {key: dict(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+              for key, value in row.items()}
+    copied.update(extra)
+    return copied
+
+
+class _Snapshot:
+    # Immutable view of one version of the file, swapped as a whole on reload so readers never see half an index
+    def __init__(self, reports: List[Dict[str, Any]], serialize: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self.rows = [serialize(r) for r in reports]
+        # lower-cased value -> ids of the reports having it, ids in file order
+        self.indexes: Dict[str, Dict[str, List[int]]] = {name: {} for name in INDEXED_FIELDS}
+        for i, report in enumerate(reports):
+            for name in INDEXED_FIELDS:
+                self.indexes[name].setdefault(_field(report, name).lower(), []).append(i)
+        # ids newest first (stable, like sorted(..., reverse=True) on the timestamps) and each id's position in it
+        self.recent = sorted(range(len(reports)), key=lambda i: reports[i]["timestamp"], reverse=True)
+        self.recent_rank = [0] * len(reports)
+        for rank, i in enumerate(self.recent):
+            self.recent_rank[i] = rank
+        self.spatial = GridIndex([(float(r["location"]["latitude"]), float(r["location"]["longitude"])) for r in reports])
+
+    def lookup(self, fields: List[str], term: str) -> set:
+        # reports whose lower-cased field contains term (the substring match of the original tool), tested
+        # against the distinct values of the index rather than the rows; an empty term matches nothing
+        term = term.lower()
+        ids = set()
+        if not term:
+            return ids
+        for name in fields:
+            index = self.indexes[name]
+            if term in index:
+                ids.update(index[term])
+            for value, postings in index.items():
+                if term in value and value != term:
+                    ids.update(postings)
+        return ids
+
+
+class DisasterStore:
+    """
+    disasters.json loaded once, indexed by lower-cased type, city, region, country and damage level, and
+    reloaded when the file's modification time changes. A file that fails to parse keeps the previous
+    version serving.
+    """
+
+    def __init__(self, path: str, serialize: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self.path = path
+        self.serialize = serialize
+        self.lock = threading.Lock()
+        self.snapshot: Optional[_Snapshot] = None
+        self.mtime = None
+        self.checked_at = 0.0
+        self.reloads = 0
+
+    def _current(self) -> _Snapshot:
+        now = time.monotonic()
+        if self.snapshot is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.snapshot
+        with self.lock:
+            self.checked_at = now
+            mtime = os.stat(self.path).st_mtime_ns
+            if self.snapshot is None or mtime != self.mtime:
+                try:
+                    with open(self.path, "r") as file:
+                        reports = json.load(file).get("disaster_reports", [])
+                    self.snapshot = _Snapshot(reports, self.serialize)
+                    self.mtime = mtime
+                    self.reloads += 1
+                except (ValueError, KeyError) as error:
+                    if self.snapshot is None:
+                        raise
+                    print(f"Keeping the previous disaster data, reload failed: {error}")
+            return self.snapshot
+
+    def query(self, query: str) -> Dict[str, Any]:
+        # same query language as before: "in <location>", "type <type>", "with <damage level>", "recent"
+        snapshot = self._current()
+        query = query.lower()
+        ids = None
+
+        if "in " in query:
+            ids = snapshot.lookup(["city", "region", "country"], query.split("in ")[1].strip())
+        if "type " in query:
+            found = snapshot.lookup(["type"], query.split("type ")[1].strip())
+            ids = found if ids is None else ids & found
+        if "with " in query:
+            found = snapshot.lookup(["damage_level"], query.split("with ")[1].strip())
+            ids = found if ids is None else ids & found
+
+        if "recent" in query:
+            order = snapshot.recent if ids is None else sorted(ids, key=snapshot.recent_rank.__getitem__)
+        else:
+            order = range(len(snapshot.rows)) if ids is None else sorted(ids)
+
+        result = [_copy_row(snapshot.rows[i]) for i in order]
+        return {
+            "count": len(result),
+            "disasters": result
+        }
+
+    def _with_distances(self, snapshot: _Snapshot, found, limit: Optional[int] = None) -> Dict[str, Any]:
+        # count is every match, disasters at most limit of them
+        result = [_copy_row(snapshot.rows[i], distance_km=round(d, 3)) for d, i in found[:limit]]
+        return {
+            "count": len(found),
+            "disasters": result
+        }
+
+    def near(self, latitude: float, longitude: float, radius_km: float, limit: Optional[int] = None) -> Dict[str, Any]:
+        # reports within radius_km of the point, nearest first
+        snapshot = self._current()
+        return self._with_distances(snapshot, snapshot.spatial.within_radius(latitude, longitude, radius_km), limit)
+
+    def nearest(self, latitude: float, longitude: float, k: int) -> Dict[str, Any]:
+        snapshot = self._current()
+        return self._with_distances(snapshot, snapshot.spatial.nearest(latitude, longitude, k))
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: Optional[int] = None) -> Dict[str, Any]:
+        # most recent first when the result is capped, file order otherwise
+        snapshot = self._current()
+        found = snapshot.spatial.in_bbox(min_lat, min_lon, max_lat, max_lon)
+        count = len(found)
+        if limit is not None and count > limit:
+            found = sorted(found, key=snapshot.recent_rank.__getitem__)[:limit]
+        return {
+            "count": count,
+            "disasters": [_copy_row(snapshot.rows[i]) for i in found]
+        }
+
+    def rows(self) -> List[Dict[str, Any]]:
+        # every report of the current version, in file order
+        return [_copy_row(row) for row in self._current().rows]
+
+    def version(self) -> int:
+        # changes on every successful reload, for consumers that derive state from the reports
+        self._current()
+        return self.reloads
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._current()
+        return {
+            "reports": len(snapshot.rows),
+            "reloads": self.reloads,
+            "distinct": {name: len(index) for name, index in snapshot.indexes.items()}
+        }
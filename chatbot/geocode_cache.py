@@ -0,0 +1,111 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# next to this module by default, not in whatever directory the server was started from
+GEOCODE_CACHE_DB = os.getenv("GEOCODE_CACHE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocode_cache.sqlite"))
+GEOCODE_TTL = float(os.getenv("GEOCODE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(3600)))
+GEOCODE_MEMORY_ENTRIES = int(os.getenv("GEOCODE_MEMORY_ENTRIES", "4096"))
+
+NOT_FOUND = "Location not found"
+
+
+def normalize_place(place_name: str) -> str:
+    # "  Fès ", "FES" and "fes" share one entry: no accents, lower case, single spaces
+    text = unicodedata.normalize("NFKD", place_name)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text.lower()).strip(" ,.")
+    return text
+
+
+class GeocodeCache:
+    """
+    Two tiers: an LRU dict in the process, then a SQLite table shared by all workers on the machine and kept
+    across restarts. Found places live for ttl seconds, "Location not found" answers for negative_ttl.
+    Transient errors (timeouts, HTTP failures) are never stored.
+    """
+
+    def __init__(self, db_path: str = GEOCODE_CACHE_DB, ttl: float = GEOCODE_TTL, negative_ttl: float = GEOCODE_NEGATIVE_TTL,
+                 max_entries: int = GEOCODE_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self.db.commit()
+        self.stats_counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "negative_hits": 0, "stores": 0}
+
+    def _remember(self, key: str, value: Dict[str, Any], expires_at: float):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, place_name: str) -> Optional[Dict[str, Any]]:
+        key = normalize_place(place_name)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[0] > now:
+                self.memory.move_to_end(key)
+                self._count_hit("memory_hits", entry[1])
+                return entry[1]
+            row = self.db.execute("SELECT value, expires_at FROM geocode WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self._count_hit("disk_hits", value)
+                return value
+            self.stats_counts["misses"] += 1
+        return None
+
+    def _count_hit(self, tier: str, value: Dict[str, Any]):
+        self.stats_counts[tier] += 1
+        if value.get("error") == NOT_FOUND:
+            self.stats_counts["negative_hits"] += 1
+
+    def put(self, place_name: str, value: Dict[str, Any]):
+        if "error" in value and value["error"] != NOT_FOUND:
+            return
+        key = normalize_place(place_name)
+        expires_at = time.time() + (self.negative_ttl if "error" in value else self.ttl)
+        with self.lock:
+            self._remember(key, value, expires_at)
+            self.db.execute("INSERT OR REPLACE INTO geocode (key, value, expires_at) VALUES (?, ?, ?)", (key, json.dumps(value), expires_at))
+            self.db.commit()
+            self.stats_counts["stores"] += 1
+
+    def purge_expired(self):
+        with self.lock:
+            self.db.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),))
+            self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            counts = dict(self.stats_counts)
+            counts["memory_entries"] = len(self.memory)
+        lookups = counts["memory_hits"] + counts["disk_hits"] + counts["misses"]
+        counts["hit_rate"] = (counts["memory_hits"] + counts["disk_hits"]) / lookups if lookups else 0.0
+        return counts
+
+
+_cache: Optional[GeocodeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_geocode_cache() -> GeocodeCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GeocodeCache()
+    return _cache
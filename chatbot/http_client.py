@@ -0,0 +1,169 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+
+# Timeouts in seconds and retry policy for the external APIs the agent tools call, overridable from the environment
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.25"))
+MAX_BACKOFF = float(os.getenv("HTTP_MAX_BACKOFF", "4"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, Any]] = {}
+
+
+def get_session() -> requests.Session:
+    # one keep-alive connection pool per host, shared by every thread
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=POOL_SIZE, pool_block=False)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    # created on first use inside the running event loop
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=10 * POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+        )
+    return _async_client
+
+
+async def aclose():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def backoff_delay(attempt: int) -> float:
+    # exponential backoff with full jitter so retrying clients do not hit the upstream in lockstep
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+
+
+def _record(url: str, seconds: float, status: Optional[int], retries: int, error: bool, via_async: bool = False):
+    host = urlsplit(url).netloc
+    with _metrics_lock:
+        m = _metrics.setdefault(host, {"requests": 0, "async_requests": 0, "errors": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0, "statuses": {}})
+        m["requests"] += 1
+        if via_async:
+            m["async_requests"] += 1
+        m["retries"] += retries
+        m["total_seconds"] += seconds
+        m["max_seconds"] = max(m["max_seconds"], seconds)
+        if error:
+            m["errors"] += 1
+        if status is not None:
+            m["statuses"][str(status)] = m["statuses"].get(str(status), 0) + 1
+
+
+def get(url: str, params: Optional[Dict[str, Any]] = None) -> requests.Response:
+    """
+    GET through the shared session with connect/read timeouts. Connection errors, timeouts, 429 and 5xx
+    are retried up to MAX_RETRIES times with jittered backoff; the last response or error is returned/raised.
+    """
+    session = get_session()
+    t0 = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            response = session.get(url, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                _record(url, time.perf_counter() - t0, response.status_code, attempt, response.status_code >= 400)
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= MAX_RETRIES:
+                _record(url, time.perf_counter() - t0, None, attempt, True)
+                raise
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+async def aget(url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+    # same policy as get() on the shared async client
+    client = get_async_client()
+    t0 = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            response = await client.get(url, params=params)
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                _record(url, time.perf_counter() - t0, response.status_code, attempt, response.status_code >= 400, True)
+                return response
+        except (httpx.TransportError, httpx.TimeoutException):
+            if attempt >= MAX_RETRIES:
+                _record(url, time.perf_counter() - t0, None, attempt, True, True)
+                raise
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def _sync_pool_stats() -> Dict[str, Any]:
+    # open keep-alive pools of the sync session, per host
+    pools = {}
+    if _session is not None:
+        adapter = _session.get_adapter("https://")
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools[pool.host] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "maxsize": POOL_SIZE
+            }
+    return pools
+
+
+def _async_pool_stats() -> Dict[str, Any]:
+    # connections of the async client's httpcore pool, per host; httpx keeps no request counts of its own,
+    # they are the async_requests of the per-host upstream metrics
+    pools: Dict[str, Any] = {}
+    client = _async_client
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return pools
+    for connection in list(getattr(pool, "connections", [])):
+        origin = getattr(connection, "_origin", None)
+        if origin is None:
+            continue
+        host = origin.host.decode("ascii", "replace") if isinstance(origin.host, bytes) else str(origin.host)
+        stats = pools.setdefault(host, {"connections": 0, "idle": 0, "max_keepalive": POOL_SIZE, "max_connections": 10 * POOL_SIZE})
+        stats["connections"] += 1
+        if connection.is_idle():
+            stats["idle"] += 1
+    return pools
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {"sync": _sync_pool_stats(), "async": _async_pool_stats()}
+
+
+def http_stats() -> Dict[str, Any]:
+    with _metrics_lock:
+        upstreams = {host: dict(m, mean_seconds=m["total_seconds"] / max(m["requests"], 1)) for host, m in _metrics.items()}
+    return {"upstreams": upstreams, "pools": pool_stats()}
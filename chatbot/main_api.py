@@ -1,12 +1,34 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List
+from contextlib import asynccontextmanager
 import uvicorn
-from agent import initialize_agent_executor
+from fastapi.responses import StreamingResponse
+from agent import initialize_agent_executor, astream_agent
+import json
+import http_client
+from geocode_cache import get_geocode_cache
+from agent_tools import blocking_pool, get_shelter_fields
+import asyncio
 from voice_api import router as voice_router
 
-app = FastAPI()
+def warm_shelter_fields():
+    try:
+        get_shelter_fields().refresh()
+    except Exception as error:
+        print(f"Shelter fields not available: {error}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One executor and LLM client for the whole process, its connection pool stays warm between messages
+    app.state.agent_executor = initialize_agent_executor()
+    # the nearest-shelter fields are computed in the background, the first lookups wait for them if needed
+    asyncio.get_running_loop().run_in_executor(blocking_pool, warm_shelter_fields)
+    yield
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORSMiddleware with more permissive settings
 app.add_middleware(
@@ -18,8 +40,13 @@ app.add_middleware(
     expose_headers=["*"]  # Expose all headers
 )
 
+class ChatMessage(BaseModel):
+    role: str  # "user" or "assistant"
+    content: str
+
 class RequestModel(BaseModel):
     message: str
+    history: List[ChatMessage] = []
     
 class ResponseModel(BaseModel):
     output: str
@@ -27,8 +54,12 @@ class ResponseModel(BaseModel):
     imageURL: Optional[str] = None
     locationCoordinates: Optional[Dict[str, str]] = None
 
+def chat_history(history):
+    # per-request conversation, in the (role, content) form the prompt's chat_history placeholder takes
+    return [("human" if m.role == "user" else "ai", m.content) for m in history]
+
 @app.post("/response", response_model=ResponseModel)
-async def get_response(request: RequestModel):
+async def get_response(request: RequestModel, http_request: Request):
     # Process the message from the request body
     if not request.message:
         raise HTTPException(status_code=400, detail="Message is required")
@@ -36,8 +67,9 @@ async def get_response(request: RequestModel):
     print(f"Received message: {request.message}")
     
     try:
-        agent_executor = initialize_agent_executor()
-        response = agent_executor.invoke({"input": request.message})
+        agent_executor = http_request.app.state.agent_executor
+        # ainvoke end to end: a slow LLM or Mapbox call only suspends this request, not the event loop
+        response = await agent_executor.ainvoke({"input": request.message, "chat_history": chat_history(request.history)})
         
         print(f"Agent response: {response}")
         
@@ -52,6 +84,38 @@ async def get_response(request: RequestModel):
         print(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@app.post("/response/stream")
+async def stream_response(request: RequestModel, http_request: Request):
+    # Server-sent events: tool progress and the answer text as it is generated, the structured fields last
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
+
+    agent_executor = http_request.app.state.agent_executor
+
+    async def events():
+        try:
+            async for event, data in astream_agent(agent_executor, {"input": request.message, "chat_history": chat_history(request.history)}):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics/http")
+async def get_http_metrics():
+    # upstream latency per host and keep-alive pool usage of the agent tools
+    return http_client.http_stats()
+
+@app.get("/metrics/geocode")
+async def get_geocode_metrics():
+    return get_geocode_cache().stats()
+
+@app.get("/metrics/shelters")
+async def get_shelter_metrics():
+    return get_shelter_fields().stats()
+
 @app.options("/response")
 async def options_response():
     return {}
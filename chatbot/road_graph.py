@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import math
+import heapq
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from spatial_index import EARTH_RADIUS_KM, GridIndex, haversine_km
+from route_hazards import HAZARD_RADIUS_KM, SegmentGrid, encode_polyline, hazard_zone, point_segment_distances_km
+
+ROAD_GRAPH_PATH = os.getenv("ROAD_GRAPH_PATH", "road_graph_sample.json")
+# An edge inside hazard zones costs time * (1 + weight * sum of the zones' severities)
+HAZARD_PENALTY_WEIGHT = float(os.getenv("HAZARD_PENALTY_WEIGHT", "2"))
+# Farthest a place may be from the closest graph node to be routed from/to
+MAX_SNAP_KM = float(os.getenv("ROUTING_MAX_SNAP_KM", "10"))
+
+# Default speeds in km/h of the OSM highway classes routable by car
+HIGHWAY_SPEEDS = {
+    "motorway": 110, "trunk": 90, "primary": 70, "secondary": 60, "tertiary": 50,
+    "motorway_link": 60, "trunk_link": 50, "primary_link": 50, "secondary_link": 40, "tertiary_link": 40,
+    "unclassified": 40, "residential": 30, "living_street": 10, "service": 20, "road": 30
+}
+
+
+def _edge_lengths_m(lat: np.ndarray, lon: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    p1, p2 = np.radians(lat[u]), np.radians(lat[v])
+    dl = np.radians(lon[v] - lon[u])
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2000 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+class RoadGraph:
+    """
+    Road network in compressed sparse row form: the edges leaving node i are indices[indptr[i]:indptr[i + 1]],
+    with their length and free-flow travel time in parallel arrays. Hazard penalties are a separate per-edge
+    array updated from the disaster store zone by zone, so the graph itself is only built once.
+    """
+
+    def __init__(self, node_ids: List[Any], lat, lon, u, v, length_m, time_s):
+        u = np.asarray(u, dtype=np.int64)
+        order = np.argsort(u, kind="stable")
+        self.node_ids = list(node_ids)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(u, minlength=len(self.lat)))])
+        self.sources = u[order]
+        self.indices = np.asarray(v, dtype=np.int64)[order]
+        self.length_m = np.asarray(length_m, dtype=float)[order]
+        self.time_s = np.asarray(time_s, dtype=float)[order]
+        self.max_speed = float((self.length_m / np.maximum(self.time_s, 1e-9)).max()) if len(self.time_s) else 1.0
+
+        self.node_index = GridIndex(list(zip(self.lat.tolist(), self.lon.tolist())))
+        # edges bucketed by their bounding box, cells about the size of a typical edge or of the largest zone
+        a = np.stack([self.lat[self.sources], self.lon[self.sources]], axis=1)
+        b = np.stack([self.lat[self.indices], self.lon[self.indices]], axis=1)
+        extent = float(np.median(np.abs(b - a).max(axis=1))) if len(a) else 0.0
+        self.edge_index = SegmentGrid(a, b, max(extent, max(HAZARD_RADIUS_KM.values()) / 111.0))
+        # sum of the severities of the hazard zones crossing each edge, and the edges of every zone applied
+        self.hazard = np.zeros(len(self.indices))
+        self.zones: Dict[Tuple[float, float, float, float], np.ndarray] = {}
+        self.hazard_version = None
+        self.lock = threading.Lock()
+
+        # the search walks plain lists, numpy scalar access is much slower one element at a time
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._sources = self.sources.tolist()
+        self._lat = self.lat.tolist()
+        self._lon = self.lon.tolist()
+        self._times = self.time_s.tolist()
+        self._costs = self._times
+
+    @classmethod
+    def from_edges(cls, node_ids, lat, lon, u, v, speed_kmh, oneway, length_m=None) -> "RoadGraph":
+        # undirected edges are stored once per direction; lengths default to the straight line between the nodes
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        u, v = np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64)
+        speed_kmh = np.asarray(speed_kmh, dtype=float)
+        both = ~np.asarray(oneway, dtype=bool)
+        if length_m is None:
+            length_m = _edge_lengths_m(lat, lon, u, v)
+        length_m = np.asarray(length_m, dtype=float)
+        u, v = np.concatenate([u, v[both]]), np.concatenate([v, u[both]])
+        speed_kmh = np.concatenate([speed_kmh, speed_kmh[both]])
+        length_m = np.concatenate([length_m, length_m[both]])
+        return cls(node_ids, lat, lon, u, v, length_m, length_m / (speed_kmh / 3.6))
+
+    def save(self, path: str):
+        np.savez(path, node_ids=np.asarray(self.node_ids), lat=self.lat, lon=self.lon, u=self.sources, v=self.indices,
+                 length_m=self.length_m, time_s=self.time_s)
+
+    def nearest_node(self, lat: float, lon: float) -> int:
+        found = self.node_index.nearest(lat, lon, 1)
+        if not found or found[0][0] > MAX_SNAP_KM:
+            raise ValueError(f"({lat}, {lon}) is outside the road graph")
+        return found[0][1]
+
+    def _edges_near(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        # edges sharing a cell of the edge index with the zone's bounding box, then the exact segment distance
+        # on those only
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        candidates = self.edge_index.query(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        a, b = self.sources[candidates], self.indices[candidates]
+        distances = point_segment_distances_km(lat, lon, self.lat[a], self.lon[a], self.lat[b], self.lon[b])
+        return candidates[distances <= radius_km]
+
+    def update_hazards(self, reports: List[Dict[str, Any]]) -> int:
+        """
+        Brings the penalties in line with the given reports: only the zones that appeared or disappeared since
+        the last update are added to or subtracted from the per-edge severities. Returns how many changed.
+        """
+        zones = {hazard_zone(r) for r in reports}
+        with self.lock:
+            added = zones - self.zones.keys()
+            removed = self.zones.keys() - zones
+            if not added and not removed:
+                return 0
+            # searches in flight keep the previous arrays, the new ones are swapped in at the end
+            hazard = self.hazard.copy()
+            for zone in removed:
+                hazard[self.zones.pop(zone)] -= zone[3]
+            for zone in added:
+                edges = self._edges_near(*zone[:3])
+                self.zones[zone] = edges
+                hazard[edges] += zone[3]
+            np.maximum(hazard, 0, out=hazard)
+            self.hazard = hazard
+            self._costs = (self.time_s * (1 + HAZARD_PENALTY_WEIGHT * hazard)).tolist()
+            return len(added) + len(removed)
+
+    def refresh(self, store):
+        # re-applies the store's reports when it has reloaded since the last refresh
+        version = store.version()
+        if version != self.hazard_version:
+            self.update_hazards(store.rows())
+            self.hazard_version = version
+
+    def edge_costs(self) -> List[float]:
+        # current per-edge costs with the hazard penalties, replaced (never modified) on every update
+        return self._costs
+
+    def shortest_path(self, source: int, target: int, penalized: bool = True) -> Optional[List[int]]:
+        """
+        A* from source to target over the edge costs, penalized or free-flow. The heuristic is the straight
+        line at the fastest speed of the graph, never more than the real cost since penalties only add to it.
+        Returns the edge ids of the path, None if target cannot be reached.
+        """
+        indptr, indices, sources = self._indptr, self._indices, self._sources
+        costs = self._costs if penalized else self._times
+        lat, lon = self._lat, self._lon
+        t_lat, t_lon = lat[target], lon[target]
+        per_km = 1000.0 / self.max_speed
+
+        best = {source: 0.0}
+        via: Dict[int, int] = {}
+        heap = [(haversine_km(lat[source], lon[source], t_lat, t_lon) * per_km, 0.0, source)]
+        while heap:
+            _, g, node = heapq.heappop(heap)
+            if node == target:
+                path = []
+                while node != source:
+                    edge = via[node]
+                    path.append(edge)
+                    node = sources[edge]
+                return path[::-1]
+            if g > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                nxt = indices[edge]
+                cost = g + costs[edge]
+                if cost < best.get(nxt, math.inf):
+                    best[nxt] = cost
+                    via[nxt] = edge
+                    heapq.heappush(heap, (cost + haversine_km(lat[nxt], lon[nxt], t_lat, t_lon) * per_km, cost, nxt))
+        return None
+
+    def _route(self, source: int, edges: List[int]) -> Dict[str, Any]:
+        # same shape as a Mapbox route, geometry as an encoded polyline
+        nodes = [source] + [self._indices[e] for e in edges]
+        return {
+            "distance": float(self.length_m[edges].sum()),
+            "duration": float(self.time_s[edges].sum()),
+            "geometry": encode_polyline([(self._lat[n], self._lon[n]) for n in nodes])
+        }
+
+    def routes(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> List[Dict[str, Any]]:
+        # the hazard-aware route, and the free-flow fastest one when it differs
+        source = self.nearest_node(start_lat, start_lon)
+        target = self.nearest_node(end_lat, end_lon)
+        found = []
+        for penalized in (True, False):
+            edges = self.shortest_path(source, target, penalized)
+            if edges is not None and all(edges != f for f in found):
+                found.append(edges)
+        return [self._route(source, edges) for edges in found]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self.node_ids),
+            "edges": len(self._indices),
+            "hazard_zones": len(self.zones),
+            "penalized_edges": int((self.hazard > 0).sum())
+        }
+
+
+def load_json(path: str) -> RoadGraph:
+    # {"nodes": [{"id", "lat", "lon"}], "edges": [{"from", "to", "speed_kmh", "oneway", "length_m"}]}, see road_graph_sample.json
+    with open(path, "r") as file:
+        data = json.load(file)
+    ids = [n["id"] for n in data["nodes"]]
+    position = {node_id: i for i, node_id in enumerate(ids)}
+    edges = data["edges"]
+    # lengths measured along the road, when every edge has one, replace the straight-line ones
+    length_m = [e["length_m"] for e in edges] if all("length_m" in e for e in edges) else None
+    return RoadGraph.from_edges(
+        ids, [n["lat"] for n in data["nodes"]], [n["lon"] for n in data["nodes"]],
+        [position[e["from"]] for e in edges], [position[e["to"]] for e in edges],
+        [e["speed_kmh"] for e in edges], [e.get("oneway", False) for e in edges], length_m
+    )
+
+
+def _speed(tags: Dict[str, str]) -> float:
+    maxspeed = tags.get("maxspeed", "").split(" ")[0]
+    if maxspeed.isdigit():
+        return float(maxspeed) * (1.609 if "mph" in tags["maxspeed"] else 1.0)
+    return float(HIGHWAY_SPEEDS[tags["highway"]])
+
+
+def load_osm(path: str) -> RoadGraph:
+    """
+    OSM XML extract (.osm, as exported by osmium or the Overpass API) -> graph of its car-routable ways,
+    one edge per pair of consecutive way nodes. Parsed as a stream, elements are freed once read.
+    """
+    coords: Dict[int, Tuple[float, float]] = {}
+    ways = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            coords[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+            element.clear()
+        elif element.tag == "way":
+            tags = {t.get("k"): t.get("v") for t in element.iter("tag")}
+            if tags.get("highway") in HIGHWAY_SPEEDS:
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                oneway = tags.get("oneway")
+                if oneway == "-1":
+                    refs.reverse()
+                is_oneway = oneway in ("yes", "1", "true", "-1") or tags["highway"] == "motorway" or tags.get("junction") == "roundabout"
+                ways.append((refs, _speed(tags), is_oneway))
+            element.clear()
+
+    position: Dict[int, int] = {}
+    u, v, speed, oneway = [], [], [], []
+    for refs, way_speed, way_oneway in ways:
+        refs = [r for r in refs if r in coords]
+        for a, b in zip(refs[:-1], refs[1:]):
+            u.append(position.setdefault(a, len(position)))
+            v.append(position.setdefault(b, len(position)))
+            speed.append(way_speed)
+            oneway.append(way_oneway)
+    ids = list(position)
+    return RoadGraph.from_edges(ids, [coords[i][0] for i in ids], [coords[i][1] for i in ids], u, v, speed, oneway)
+
+
+def load_npz(path: str) -> RoadGraph:
+    data = np.load(path)
+    return RoadGraph(data["node_ids"].tolist(), data["lat"], data["lon"], data["u"], data["v"], data["length_m"], data["time_s"])
+
+
+def load_road_graph(path: str) -> RoadGraph:
+    if path.endswith(".npz"):
+        return load_npz(path)
+    if path.endswith(".osm"):
+        return load_osm(path)
+    return load_json(path)
+
+
+_graph: Optional[RoadGraph] = None
+_graph_lock = threading.Lock()
+
+
+def get_road_graph() -> RoadGraph:
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = load_road_graph(ROAD_GRAPH_PATH)
+    return _graph
+
+
+if __name__ == "__main__":
+    # python road_graph.py extract.osm graph.npz: parse an extract once, then point ROAD_GRAPH_PATH at the .npz
+    graph = load_road_graph(sys.argv[1])
+    graph.save(sys.argv[2])
+    print(graph.stats())
@@ -0,0 +1,251 @@
+import os
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from spatial_index import EARTH_RADIUS_KM
+
+# Buffer around a report and weight of the route length inside it, by damage level
+HAZARD_RADIUS_KM = {
+    "destroyed": float(os.getenv("HAZARD_RADIUS_DESTROYED_KM", "5")),
+    "major damage": float(os.getenv("HAZARD_RADIUS_MAJOR_KM", "3")),
+    "minor damage": float(os.getenv("HAZARD_RADIUS_MINOR_KM", "1.5")),
+    "no damage": float(os.getenv("HAZARD_RADIUS_NONE_KM", "0.5")),
+}
+DEFAULT_RADIUS_KM = 2.0
+SEVERITY = {"destroyed": 4.0, "major damage": 3.0, "minor damage": 2.0, "no damage": 0.5}
+DEFAULT_SEVERITY = 2.0
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> np.ndarray:
+    """
+    Google encoded polyline (what Mapbox returns by default) -> Nx2 array of (latitude, longitude).
+    Decoded with array operations: the 5-bit chunks are split on their continuation bit, every value is
+    assembled with shifts and a segmented sum, zigzag-decoded, and the deltas are summed up per axis.
+    """
+    if not encoded:
+        return np.zeros((0, 2))
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    last = (chunks & 0x20) == 0
+    value_id = np.concatenate([[0], np.cumsum(last)[:-1]])
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    position = np.arange(len(chunks)) - starts[value_id]
+    values = np.zeros(int(last.sum()), dtype=np.int64)
+    np.add.at(values, value_id, (chunks & 0x1f) << (5 * position))
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    coords = np.cumsum(values[:len(values) // 2 * 2].reshape(-1, 2), axis=0)
+    return coords / 10.0 ** precision
+
+
+def encode_polyline(coords, precision: int = 5) -> str:
+    # inverse of decode_polyline, for routes computed locally
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        ilat, ilon = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+
+def segment_lengths_km(coords: np.ndarray) -> np.ndarray:
+    lat = np.radians(coords[:, 0])
+    lon = np.radians(coords[:, 1])
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def segment_distances_km(coords: np.ndarray, lat: float, lon: float) -> np.ndarray:
+    # distance of every segment of a polyline to the point
+    return point_segment_distances_km(lat, lon, coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+
+
+def _project(lat: float, lon: float, a_lat: np.ndarray, a_lon: np.ndarray, b_lat: np.ndarray, b_lon: np.ndarray):
+    # segments a-b in a local equirectangular projection centered on the point, in km: start and direction
+    k = np.radians(1) * EARTH_RADIUS_KM
+    coslat = np.cos(np.radians(lat))
+    x0, y0 = (a_lon - lon) * k * coslat, (a_lat - lat) * k
+    x1, y1 = (b_lon - lon) * k * coslat, (b_lat - lat) * k
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def point_segment_distances_km(lat: float, lon: float, a_lat: np.ndarray, a_lon: np.ndarray,
+                               b_lat: np.ndarray, b_lon: np.ndarray) -> np.ndarray:
+    # distance of independent segments a-b to the point, in a local equirectangular projection centered on it
+    x0, y0, dx, dy = _project(lat, lon, a_lat, a_lon, b_lat, b_lon)
+    length2 = dx * dx + dy * dy
+    t = np.where(length2 > 0, -(x0 * dx + y0 * dy) / np.where(length2 > 0, length2, 1), 0)
+    t = np.clip(t, 0, 1)
+    return np.hypot(x0 + t * dx, y0 + t * dy)
+
+
+def chord_intervals(lat: float, lon: float, radius_km: float, a_lat: np.ndarray, a_lon: np.ndarray,
+                    b_lat: np.ndarray, b_lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Part of every segment a-b inside the circle of radius_km around the point, as the [t0, t1] fraction
+    of the segment (t0 == t1 when it misses the circle), from the intersection of the projected segment
+    with the circle.
+    """
+    x0, y0, dx, dy = _project(lat, lon, a_lat, a_lon, b_lat, b_lon)
+    a = dx * dx + dy * dy
+    b = 2 * (x0 * dx + y0 * dy)
+    c = x0 * x0 + y0 * y0 - radius_km * radius_km
+    disc = b * b - 4 * a * c
+    degenerate = a <= 0
+    root = np.sqrt(np.maximum(disc, 0))
+    safe_a = np.where(degenerate, 1, a)
+    t0 = np.clip((-b - root) / (2 * safe_a), 0, 1)
+    t1 = np.clip((-b + root) / (2 * safe_a), 0, 1)
+    # a zero length segment is inside when its point is
+    t0 = np.where(degenerate, 0, t0)
+    t1 = np.where(degenerate, (c <= 0).astype(float), t1)
+    missed = (disc < 0) & ~degenerate
+    t1 = np.where(missed | (t1 < t0), t0, t1)
+    return t0, t1
+
+
+class SegmentGrid:
+    """
+    Segments a-b (Nx2 arrays of latitude, longitude: the consecutive points of a polyline, or the edges of a
+    road graph) bucketed by the cells of a regular latitude/longitude grid their bounding box overlaps, so a
+    zone is only tested against the segments that share a cell with its own bounding box.
+    """
+
+    def __init__(self, a: np.ndarray, b: np.ndarray, cell_deg: float):
+        self.cell_deg = cell_deg
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        lo = np.floor(np.minimum(a, b) / cell_deg).astype(np.int64)
+        hi = np.floor(np.maximum(a, b) / cell_deg).astype(np.int64)
+        for i in range(len(lo)):
+            for y in range(lo[i, 0], hi[i, 0] + 1):
+                for x in range(lo[i, 1], hi[i, 1] + 1):
+                    self.cells.setdefault((y, x), []).append(i)
+
+    def query(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+        # ids of the segments whose bounding box may overlap the box, sorted
+        y0, x0 = int(np.floor(min_lat / self.cell_deg)), int(np.floor(min_lon / self.cell_deg))
+        y1, x1 = int(np.floor(max_lat / self.cell_deg)), int(np.floor(max_lon / self.cell_deg))
+        found = set()
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self.cells):
+            for (y, x), ids in self.cells.items():
+                if y0 <= y <= y1 and x0 <= x <= x1:
+                    found.update(ids)
+        else:
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    found.update(self.cells.get((y, x), ()))
+        return np.array(sorted(found), dtype=np.int64)
+
+
+def _covered(intervals: List[Tuple[float, float, float]]) -> Tuple[float, float]:
+    # fraction of a segment covered by the union of its [t0, t1] intervals, and the same weighted by the
+    # highest severity covering each part
+    points = sorted({t for t0, t1, _ in intervals for t in (t0, t1)})
+    covered = weighted = 0.0
+    for lo, hi in zip(points[:-1], points[1:]):
+        severities = [w for t0, t1, w in intervals if t0 <= lo and hi <= t1]
+        if severities:
+            covered += hi - lo
+            weighted += (hi - lo) * max(severities)
+    return covered, weighted
+
+
+def hazard_zone(row: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    level = str(row.get("damage_level", "")).lower()
+    return (float(row["location"]["latitude"]), float(row["location"]["longitude"]),
+            HAZARD_RADIUS_KM.get(level, DEFAULT_RADIUS_KM), SEVERITY.get(level, DEFAULT_SEVERITY))
+
+
+def _ranges(mask: np.ndarray) -> List[List[int]]:
+    # [first, last] segment indices of every run of True
+    if not mask.any():
+        return []
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return [[int(a), int(b) - 1] for a, b in zip(edges[::2], edges[1::2])]
+
+
+def score_route(coords: np.ndarray, store) -> Dict[str, Any]:
+    """
+    Exposure of one decoded route to the disaster reports of the store: only the reports in the route's
+    bounding box grown by the largest buffer are looked at (through the store's spatial index), and each
+    of them only against the segments sharing a cell of a grid over the route with its buffer. The length
+    counted inside a buffer is the part of each segment within the circle, overlapping buffers once.
+    """
+    if len(coords) < 2:
+        return {"exposure_km": 0.0, "weighted_exposure": 0.0, "hazards": [], "affected_segments": []}
+    margin = max(HAZARD_RADIUS_KM.values()) / 111.0
+    min_lat, min_lon = coords.min(axis=0)
+    max_lat, max_lon = coords.max(axis=0)
+    margin_lon = margin / max(np.cos(np.radians(max(abs(min_lat), abs(max_lat)))), 1e-6)
+    candidates = store.in_bbox(min_lat - margin, min_lon - margin_lon, max_lat + margin, max_lon + margin_lon)["disasters"]
+
+    lengths = segment_lengths_km(coords)
+    affected = np.zeros(len(lengths), dtype=bool)
+    # per segment, the [t0, t1] parts inside a buffer with that buffer's severity
+    intervals: Dict[int, List[Tuple[float, float, float]]] = {}
+    hazards = []
+    grid = None
+    for row in candidates:
+        lat, lon, radius, severity = hazard_zone(row)
+        if grid is None:
+            # cells about the size of the largest buffer, or of a typical segment when they are longer
+            extent = np.abs(np.diff(coords, axis=0)).max(axis=1)
+            grid = SegmentGrid(coords[:-1], coords[1:], max(margin, float(np.median(extent))))
+        dlat = radius / 111.0
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        ids = grid.query(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        if len(ids) == 0:
+            continue
+        a, b = coords[ids], coords[ids + 1]
+        distances = point_segment_distances_km(lat, lon, a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+        inside = distances <= radius
+        if not inside.any():
+            continue
+        ids, distances = ids[inside], distances[inside]
+        t0, t1 = chord_intervals(lat, lon, radius, a[inside, 0], a[inside, 1], b[inside, 0], b[inside, 1])
+        for i, lo, hi in zip(ids.tolist(), t0.tolist(), t1.tolist()):
+            if hi > lo:
+                intervals.setdefault(i, []).append((lo, hi, severity))
+        mask = np.zeros(len(lengths), dtype=bool)
+        mask[ids] = True
+        affected |= mask
+        hazards.append({
+            "type": row["type"],
+            "city": row["location"].get("city"),
+            "damage_level": row["damage_level"],
+            "closest_km": round(float(distances.min()), 3),
+            "length_inside_km": round(float((lengths[ids] * (t1 - t0)).sum()), 3),
+            "segments": _ranges(mask)
+        })
+    hazards.sort(key=lambda h: h["closest_km"])
+    exposure = weighted = 0.0
+    for i, parts in intervals.items():
+        covered, covered_weighted = _covered(parts)
+        exposure += lengths[i] * covered
+        weighted += lengths[i] * covered_weighted
+    return {
+        "exposure_km": round(float(exposure), 3),
+        "weighted_exposure": round(float(weighted), 3),
+        "hazards": hazards,
+        "affected_segments": _ranges(affected)
+    }
+
+
+def rank_routes(routes: List[Dict[str, Any]], store) -> List[Dict[str, Any]]:
+    # Mapbox routes (geometry as encoded polyline) with their exposure, least exposed first, then fastest
+    ranked = []
+    for route in routes:
+        scored = {"distance": route["distance"], "duration": route["duration"], "geometry": route["geometry"]}
+        scored.update(score_route(decode_polyline(route["geometry"]), store))
+        ranked.append(scored)
+    ranked.sort(key=lambda r: (r["weighted_exposure"], r["duration"]))
+    return ranked
@@ -0,0 +1,252 @@
+import os
+import json
+import math
+import time
+import heapq
+import threading
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from road_graph import RoadGraph
+
+SHELTERS_PATH = os.getenv("SHELTERS_PATH", "shelters.json")
+# How often at most the shelters file's mtime is checked, in seconds
+RELOAD_CHECK_INTERVAL = float(os.getenv("SHELTERS_RELOAD_CHECK_INTERVAL", "1"))
+
+
+class ShelterFields:
+    """
+    For every node of the road graph, the open shelter or evacuation point reachable fastest from it, with
+    the travel time and distance, from one multi-source Dijkstra over the reversed edges. A lookup is then
+    a nearest-node query plus a few list reads.
+
+    The fields follow the shelters file and the graph's hazard penalties incrementally: an opened shelter
+    only spreads over the nodes it is closer to, a closed one or a more expensive edge only invalidates the
+    nodes whose shortest path went through it, which are then re-seeded from their still valid neighbours.
+    """
+
+    def __init__(self, graph: RoadGraph, path: str = SHELTERS_PATH, store=None):
+        self.graph = graph
+        self.path = path
+        self.store = store
+        self.lock = threading.Lock()
+        n = len(graph.node_ids)
+
+        # edges entering each node, the search walks from the shelters against the direction of travel
+        self.rev_indptr = np.concatenate([[0], np.cumsum(np.bincount(graph.indices, minlength=n))]).tolist()
+        self.rev_edges = np.argsort(graph.indices, kind="stable").tolist()
+        self.indptr = graph.indptr.tolist()
+        self.tails = graph.sources.tolist()
+        self.heads = graph.indices.tolist()
+        self.lengths = graph.length_m.tolist()
+        self.times = graph.time_s.tolist()
+        self.costs: List[float] = []
+        self.hazard = None
+
+        # per node: penalized cost to its shelter (what the search minimizes), free-flow time and length of
+        # that path, the shelter id and the first edge of the path
+        self.cost = [math.inf] * n
+        self.time_s = [0.0] * n
+        self.meters = [0.0] * n
+        self.owner: List[Optional[str]] = [None] * n
+        self.via = [-1] * n
+
+        self.shelters: Dict[str, Dict[str, Any]] = {}
+        self.mtime = None
+        self.checked_at = 0.0
+        self.counts = {"full": 0, "incremental": 0, "last_seconds": 0.0}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        # open shelters by id, each with the graph node it is reached at
+        with open(self.path, "r") as file:
+            records = json.load(file).get("shelters", [])
+        shelters = {}
+        for record in records:
+            if record.get("status", "open") != "open":
+                continue
+            try:
+                node = self.graph.nearest_node(float(record["location"]["latitude"]), float(record["location"]["longitude"]))
+            except ValueError as error:
+                print(f"Skipping shelter {record['id']}: {error}")
+                continue
+            shelters[record["id"]] = {"record": record, "node": node}
+        return shelters
+
+    def _propagate(self, heap: List[tuple]):
+        # Dijkstra that only ever lowers labels, so it can resume from any set of improved nodes
+        cost, time_s, meters, owner, via = self.cost, self.time_s, self.meters, self.owner, self.via
+        rev_indptr, rev_edges, tails, costs, times, lengths = self.rev_indptr, self.rev_edges, self.tails, self.costs, self.times, self.lengths
+        while heap:
+            c, node = heapq.heappop(heap)
+            if c > cost[node]:
+                continue
+            for i in range(rev_indptr[node], rev_indptr[node + 1]):
+                edge = rev_edges[i]
+                prev = tails[edge]
+                candidate = c + costs[edge]
+                if candidate < cost[prev]:
+                    cost[prev] = candidate
+                    time_s[prev] = time_s[node] + times[edge]
+                    meters[prev] = meters[node] + lengths[edge]
+                    owner[prev] = owner[node]
+                    via[prev] = edge
+                    heapq.heappush(heap, (candidate, prev))
+
+    def _seed_shelters(self, heap: List[tuple]):
+        for shelter_id, shelter in self.shelters.items():
+            node = shelter["node"]
+            if self.cost[node] > 0:
+                self.cost[node] = 0.0
+                self.time_s[node] = self.meters[node] = 0.0
+                self.owner[node] = shelter_id
+                self.via[node] = -1
+                heapq.heappush(heap, (0.0, node))
+
+    def _invalidate(self, nodes: List[int], heap: List[tuple]):
+        # forget the labels of nodes, then give each the best label through a neighbour that kept its own
+        for node in nodes:
+            self.cost[node] = math.inf
+            self.owner[node] = None
+            self.via[node] = -1
+        for node in nodes:
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                head = self.heads[edge]
+                candidate = self.cost[head] + self.costs[edge]
+                if candidate < self.cost[node]:
+                    self.cost[node] = candidate
+                    self.time_s[node] = self.time_s[head] + self.times[edge]
+                    self.meters[node] = self.meters[head] + self.lengths[edge]
+                    self.owner[node] = self.owner[head]
+                    self.via[node] = edge
+            if self.cost[node] < math.inf:
+                heapq.heappush(heap, (self.cost[node], node))
+
+    def _subtrees(self, roots: List[int]) -> List[int]:
+        # roots and every node whose path to its shelter goes through one of them
+        children: Dict[int, List[int]] = {}
+        for node, edge in enumerate(self.via):
+            if edge >= 0:
+                children.setdefault(self.heads[edge], []).append(node)
+        found, stack = set(roots), list(roots)
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                if child not in found:
+                    found.add(child)
+                    stack.append(child)
+        return list(found)
+
+    def _compute_all(self):
+        n = len(self.cost)
+        self.cost = [math.inf] * n
+        self.time_s = [0.0] * n
+        self.meters = [0.0] * n
+        self.owner = [None] * n
+        self.via = [-1] * n
+        heap: List[tuple] = []
+        self._seed_shelters(heap)
+        self._propagate(heap)
+        self.counts["full"] += 1
+
+    def _apply_penalties(self, old_hazard: np.ndarray, new_hazard: np.ndarray):
+        heap: List[tuple] = []
+        increased = np.flatnonzero(new_hazard > old_hazard).tolist()
+        decreased = np.flatnonzero(new_hazard < old_hazard).tolist()
+        # only nodes whose path used a now more expensive edge can get worse
+        self._invalidate(self._subtrees([self.tails[e] for e in increased if self.via[self.tails[e]] == e]), heap)
+        for edge in decreased:
+            tail, head = self.tails[edge], self.heads[edge]
+            candidate = self.cost[head] + self.costs[edge]
+            if candidate < self.cost[tail]:
+                self.cost[tail] = candidate
+                self.time_s[tail] = self.time_s[head] + self.times[edge]
+                self.meters[tail] = self.meters[head] + self.lengths[edge]
+                self.owner[tail] = self.owner[head]
+                self.via[tail] = edge
+                heapq.heappush(heap, (candidate, tail))
+        self._propagate(heap)
+
+    def _apply_shelters(self, shelters: Dict[str, Dict[str, Any]]):
+        old = self.shelters
+        closed = {i for i in old if i not in shelters or shelters[i]["node"] != old[i]["node"]}
+        opened = {i for i in shelters if i not in old or i in closed}
+        self.shelters = shelters
+        heap: List[tuple] = []
+        if closed:
+            self._invalidate(self._subtrees([n for n, o in enumerate(self.owner) if o in closed]), heap)
+        # seeding every open shelter covers the opened ones and any that shares a node with a closed one
+        if opened or closed:
+            self._seed_shelters(heap)
+        self._propagate(heap)
+
+    def refresh(self):
+        """
+        Brings the fields up to date with the graph's hazard penalties (re-applied from the disaster store
+        first, when one is given) and with the shelters file, recomputing only what changed.
+        """
+        if self.store is not None:
+            self.graph.refresh(self.store)
+        with self.graph.lock:
+            hazard, costs = self.graph.hazard, self.graph.edge_costs()
+        now = time.monotonic()
+        check_file = now - self.checked_at >= RELOAD_CHECK_INTERVAL
+        if hazard is self.hazard and not check_file:
+            return
+
+        with self.lock:
+            t0 = time.perf_counter()
+            changed = False
+            if self.hazard is None:
+                self.mtime = os.stat(self.path).st_mtime_ns
+                self.shelters = self._load()
+                self.costs, self.hazard = costs, hazard
+                self.checked_at = now
+                self._compute_all()
+            else:
+                if hazard is not self.hazard:
+                    old_hazard = self.hazard
+                    self.costs, self.hazard = costs, hazard
+                    self._apply_penalties(old_hazard, hazard)
+                    changed = True
+                if check_file:
+                    self.checked_at = now
+                    mtime = os.stat(self.path).st_mtime_ns
+                    if mtime != self.mtime:
+                        try:
+                            shelters = self._load()
+                            self.mtime = mtime
+                            self._apply_shelters(shelters)
+                            changed = True
+                        except (ValueError, KeyError) as error:
+                            print(f"Keeping the previous shelters, reload failed: {error}")
+                if changed:
+                    self.counts["incremental"] += 1
+            self.counts["last_seconds"] = time.perf_counter() - t0
+
+    def nearest(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        # nearest graph node through the grid index, then its precomputed labels
+        self.refresh()
+        node = self.graph.nearest_node(latitude, longitude)
+        with self.lock:
+            owner, cost, travel_s, meters = self.owner[node], self.cost[node], self.time_s[node], self.meters[node]
+            shelter = self.shelters.get(owner) if owner is not None else None
+        if shelter is None:
+            return {"error": "No open shelter is reachable from this location"}
+        record = shelter["record"]
+        return {
+            "shelter": {
+                "id": record["id"],
+                "name": record["name"],
+                "type": record.get("type", "shelter"),
+                "capacity": record.get("capacity"),
+                "location": record["location"]
+            },
+            "travel_time_min": round(travel_s / 60, 1),
+            "distance_km": round(meters / 1000, 2),
+            "passes_hazard_zone": cost > travel_s * (1 + 1e-9)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            reachable = sum(1 for o in self.owner if o is not None)
+            return dict(self.counts, open_shelters=len(self.shelters), nodes=len(self.owner), reachable_nodes=reachable)
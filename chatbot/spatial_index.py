@@ -0,0 +1,110 @@
+import math
+from typing import Dict, List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def wrap_lon(lon: float) -> float:
+    # any longitude -> [-180, 180)
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Points bucketed in a regular latitude/longitude grid of cell_deg degrees. A query only looks at the
+    cells its area overlaps, then checks the exact great-circle distance of the points in them, so its
+    cost depends on how many points are nearby, not on how many there are in total. Longitudes wrap at
+    the antimeridian: an area crossing it is looked up as two ranges of cells.
+    """
+
+    def __init__(self, points: List[Tuple[float, float]], cell_deg: float = 0.25):
+        self.cell_deg = cell_deg
+        self.points = points
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lat, lon) in enumerate(points):
+            self.cells.setdefault(self._cell(lat, wrap_lon(lon)), []).append(i)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def _ids_in_cells(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        y0, x0 = self._cell(min_lat, min_lon)
+        y1, x1 = self._cell(max_lat, max_lon)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self.cells):
+            # the area covers more cells than are occupied, walk the occupied ones
+            for (y, x), ids in self.cells.items():
+                if y0 <= y <= y1 and x0 <= x <= x1:
+                    yield from ids
+            return
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                yield from self.cells.get((y, x), ())
+
+    def _lon_ranges(self, min_lon: float, max_lon: float) -> List[Tuple[float, float]]:
+        # [min_lon, max_lon] going east, as one or two ranges inside [-180, 180]
+        if max_lon - min_lon >= 360.0:
+            return [(-180.0, 180.0)]
+        lo, hi = wrap_lon(min_lon), wrap_lon(max_lon)
+        if lo <= hi:
+            return [(lo, hi)]
+        return [(lo, 180.0), (-180.0, hi)]
+
+    def _ids_in_area(self, min_lat: float, max_lat: float, lon_ranges: List[Tuple[float, float]]):
+        seen = set()
+        for lo, hi in lon_ranges:
+            for i in self._ids_in_cells(min_lat, lo, max_lat, hi):
+                # the two ranges of a wrapped area can share the cell at their ends
+                if i not in seen:
+                    seen.add(i)
+                    yield i
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+        # min_lon > max_lon is a box crossing the antimeridian
+        if min_lon > max_lon:
+            max_lon += 360.0
+        lon_ranges = self._lon_ranges(min_lon, max_lon)
+        res = []
+        for i in self._ids_in_area(min_lat, max_lat, lon_ranges):
+            lat, lon = self.points[i]
+            lon = wrap_lon(lon)
+            if min_lat <= lat <= max_lat and any(lo <= lon <= hi for lo, hi in lon_ranges):
+                res.append(i)
+        return sorted(res)
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int]]:
+        # (distance_km, id) of the points within radius_km, nearest first
+        r = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(r)
+        if lat + dlat >= 90.0 or lat - dlat <= -90.0:
+            # the circle contains a pole, every longitude is in it
+            lon_ranges = [(-180.0, 180.0)]
+        else:
+            # widest longitude offset of the circle, reached at its tangent meridians
+            dlon = math.degrees(math.asin(min(1.0, math.sin(r) / math.cos(math.radians(lat)))))
+            lon_ranges = self._lon_ranges(lon - dlon, lon + dlon)
+        res = []
+        for i in self._ids_in_area(max(-90.0, lat - dlat), min(90.0, lat + dlat), lon_ranges):
+            d = haversine_km(lat, lon, *self.points[i])
+            if d <= radius_km:
+                res.append((d, i))
+        res.sort()
+        return res
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[float, int]]:
+        # search radius doubles until k points are found inside it, starting from about one cell
+        if not self.points or k <= 0:
+            return []
+        radius_km = self.cell_deg * 111.0
+        while True:
+            found = self.within_radius(lat, lon, radius_km)
+            if len(found) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return found[:k]
+            radius_km *= 2
@@ -0,0 +1,52 @@
+import os
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pydantic")
+pytest.importorskip("requests")
+pytest.importorskip("httpx")
+
+import agent_tools
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("Rabat;Casablanca", ("Rabat", "Casablanca")),
+    ("Rabat to Casablanca", ("Rabat", "Casablanca")),
+    ("Rabat,Casablanca", ("Rabat", "Casablanca")),
+    ("34.02,-6.83;33.57,-7.59", ("34.02,-6.83", "33.57,-7.59")),
+    ("34.02,-6.83,33.57,-7.59", ("34.02,-6.83", "33.57,-7.59")),
+    ("34.02,-6.83 to Casablanca", ("34.02,-6.83", "Casablanca")),
+])
+def test_split_route_input(text, expected):
+    assert agent_tools.split_route_input(text) == expected
+
+
+@pytest.mark.parametrize("text", ["Rabat", "a,b,c", "Rabat;", "1,2,3"])
+def test_bad_route_input_is_a_tool_error(text):
+    assert "error" in agent_tools.safest_routes_tool(text)
+    assert "error" in asyncio.run(agent_tools.asafest_routes_tool(text))
+
+
+@pytest.fixture
+def local_routing(monkeypatch):
+    monkeypatch.chdir(HERE)
+    monkeypatch.setattr(agent_tools, "ROUTING_BACKEND", "local")
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("local routing must not call the network")
+
+    monkeypatch.setattr(agent_tools.http_client, "get", no_network)
+    monkeypatch.setattr(agent_tools.http_client, "aget", no_network)
+
+
+@pytest.mark.parametrize("text", ["34.261,-6.5802;34.265,-5.925", "34.261,-6.5802,34.265,-5.925"])
+def test_tool_routes_coordinate_endpoints_offline(local_routing, text):
+    # Kenitra to Sidi Slimane on the sample graph, no geocoding involved
+    res = agent_tools.safest_routes_tool(text)
+    assert "error" not in res, res
+    assert res["backend"] == "local" and res["distance"] > 0
+    assert asyncio.run(agent_tools.asafest_routes_tool(text))["distance"] == res["distance"]
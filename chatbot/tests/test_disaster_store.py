@@ -0,0 +1,17 @@
+import os
+
+from disaster_store import DisasterStore
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_results_are_copies_of_the_snapshot_rows():
+    store = DisasterStore(os.path.join(HERE, "disasters.json"), lambda report: report)
+    before = store.query("all disasters")["disasters"]
+    for results in (before, store.in_bbox(-90, -180, 90, 180)["disasters"], store.near(31.6, -8.0, 20000)["disasters"], store.rows()):
+        for row in results:
+            row["mutated"] = True
+            row["location"]["city"] = "mutated"
+    after = store.query("all disasters")["disasters"]
+    assert after and all("mutated" not in row and row["location"]["city"] != "mutated" for row in after)
+    assert [row["timestamp"] for row in after] == [row["timestamp"] for row in before]
@@ -0,0 +1,70 @@
+import os
+import json
+import heapq
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from road_graph import load_json
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _dijkstra(graph, source, costs):
+    # plain Dijkstra over the CSR arrays, every node's cost from source
+    dist = [math.inf] * len(graph.node_ids)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist[node]:
+            continue
+        for edge in range(graph.indptr[node], graph.indptr[node + 1]):
+            nxt = int(graph.indices[edge])
+            if d + costs[edge] < dist[nxt]:
+                dist[nxt] = d + costs[edge]
+                heapq.heappush(heap, (dist[nxt], nxt))
+    return dist
+
+
+@pytest.fixture(scope="module")
+def graph():
+    graph = load_json(os.path.join(HERE, "road_graph_sample.json"))
+    with open(os.path.join(HERE, "disasters.json")) as file:
+        graph.update_hazards(json.load(file)["disaster_reports"])
+    return graph
+
+
+@pytest.mark.parametrize("penalized", [True, False])
+def test_astar_matches_dijkstra_on_every_pair(graph, penalized):
+    costs = graph.edge_costs() if penalized else graph.time_s.tolist()
+    n = len(graph.node_ids)
+    pairs = 0
+    for source in range(n):
+        dist = _dijkstra(graph, source, costs)
+        for target in range(n):
+            path = graph.shortest_path(source, target, penalized)
+            pairs += 1
+            if math.isinf(dist[target]):
+                assert path is None
+                continue
+            assert path is not None
+            assert sum(costs[e] for e in path) == pytest.approx(dist[target], rel=1e-9, abs=1e-9)
+            # the edges form a walk from source to target
+            node = source
+            for e in path:
+                assert graph.sources[e] == node
+                node = int(graph.indices[e])
+            assert node == target
+    assert pairs == n * n
+
+
+def test_edges_near_matches_full_scan(graph):
+    from route_hazards import point_segment_distances_km
+
+    a, b = graph.sources, graph.indices
+    for lat, lon, radius in [(31.63, -7.99, 5.0), (33.57, -7.59, 30.0), (32.5, -6.5, 80.0), (0.0, 0.0, 5.0)]:
+        distances = point_segment_distances_km(lat, lon, graph.lat[a], graph.lon[a], graph.lat[b], graph.lon[b])
+        assert graph._edges_near(lat, lon, radius).tolist() == np.flatnonzero(distances <= radius).tolist()
@@ -0,0 +1,54 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from route_hazards import HAZARD_RADIUS_KM, hazard_zone, score_route, segment_lengths_km
+from spatial_index import EARTH_RADIUS_KM
+
+
+class _Store:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def in_bbox(self, *box):
+        return {"count": len(self.rows), "disasters": self.rows}
+
+
+def _sampled_exposure(coords, rows, samples=2000):
+    # route length inside the buffers and severity weighted length, from points sampled along every segment
+    zones = [hazard_zone(row) for row in rows]
+    k = np.radians(1) * EARTH_RADIUS_KM
+    lengths = segment_lengths_km(coords)
+    t = (np.arange(samples) + 0.5) / samples
+    exposure = weighted = 0.0
+    for i, length in enumerate(lengths):
+        points = coords[i] + (coords[i + 1] - coords[i]) * t[:, None]
+        severity = np.zeros(samples)
+        for lat, lon, radius, weight in zones:
+            d = np.hypot((points[:, 1] - lon) * k * np.cos(np.radians(lat)), (points[:, 0] - lat) * k)
+            severity = np.where(d <= radius, np.maximum(severity, weight), severity)
+        exposure += length * (severity > 0).mean()
+        weighted += length * severity.mean()
+    return exposure, weighted
+
+
+def test_exposure_counts_only_the_chord_inside_overlapping_buffers():
+    rng = np.random.RandomState(0)
+    coords = np.cumsum(rng.randn(300, 2) * 0.01, axis=0) + [31.6, -8.0]
+    levels = list(HAZARD_RADIUS_KM)
+    rows = [{"type": "earthquake", "damage_level": levels[i % len(levels)],
+             "location": {"latitude": 31.6 + rng.randn() * 0.05, "longitude": -8.0 + rng.randn() * 0.05, "city": "x"}}
+            for i in range(15)]
+    scored = score_route(coords, _Store(rows))
+    exposure, weighted = _sampled_exposure(coords, rows)
+    assert scored["hazards"]
+    assert scored["exposure_km"] == pytest.approx(exposure, abs=0.01)
+    assert scored["weighted_exposure"] == pytest.approx(weighted, abs=0.05)
+
+
+def test_long_segment_through_a_buffer_counts_its_chord():
+    # a 100 km straight segment through the center of a 5 km buffer is exposed over 10 km
+    coords = np.array([[31.0, -8.5], [31.0 + 100 / (np.radians(1) * EARTH_RADIUS_KM), -8.5]])
+    row = {"type": "flood", "damage_level": "destroyed", "location": {"latitude": coords[:, 0].mean(), "longitude": -8.5, "city": "x"}}
+    scored = score_route(coords, _Store([row]))
+    assert scored["exposure_km"] == pytest.approx(2 * HAZARD_RADIUS_KM["destroyed"], rel=1e-3)
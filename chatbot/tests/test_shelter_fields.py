@@ -0,0 +1,81 @@
+import os
+import json
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import shelter_fields
+from road_graph import RoadGraph
+from shelter_fields import ShelterFields
+
+LEVELS = ["destroyed", "major damage", "minor damage", "no damage"]
+
+
+def _graph(rng, n=400):
+    # random points around Marrakech, each joined to its 3 nearest neighbours, a few edges one way
+    lat = 31.6 + rng.uniform(0, 0.5, n)
+    lon = -8.0 + rng.uniform(0, 0.5, n)
+    u, v = [], []
+    for i in range(n):
+        d = (lat - lat[i]) ** 2 + (lon - lon[i]) ** 2
+        for j in np.argsort(d)[1:4]:
+            u.append(i)
+            v.append(int(j))
+    speed = rng.choice([30, 50, 70, 90], len(u))
+    oneway = rng.uniform(size=len(u)) < 0.1
+    return RoadGraph.from_edges(list(range(n)), lat, lon, u, v, speed, oneway)
+
+
+def _write_shelters(path, graph, nodes, mtime_ns):
+    records = [{"id": f"s{i}", "name": f"Shelter {i}", "status": "open",
+                "location": {"latitude": float(graph.lat[i]), "longitude": float(graph.lon[i])}} for i in nodes]
+    with open(path, "w") as file:
+        json.dump({"shelters": records}, file)
+    # the fields reload on an mtime change, which writes close together might not produce
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _reports(rng, graph, count):
+    return [{"location": {"latitude": float(graph.lat.min() + rng.uniform(0, 0.5)),
+                          "longitude": float(graph.lon.min() + rng.uniform(0, 0.5))},
+             "damage_level": LEVELS[rng.randint(len(LEVELS))]} for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_incremental_updates_match_full_recompute(tmp_path, monkeypatch, seed):
+    monkeypatch.setattr(shelter_fields, "RELOAD_CHECK_INTERVAL", 0.0)
+    rng = np.random.RandomState(seed)
+    graph = _graph(rng)
+    path = str(tmp_path / "shelters.json")
+    reports = _reports(rng, graph, 12)
+
+    shelters = set(rng.choice(len(graph.node_ids), 6, replace=False).tolist())
+    mtime_ns = 10 ** 18
+    _write_shelters(path, graph, sorted(shelters), mtime_ns)
+    fields = ShelterFields(graph, path)
+    fields.refresh()
+
+    for step in range(30):
+        # zones appearing and disappearing raise and lower edge costs
+        graph.update_hazards([r for r in reports if rng.uniform() < 0.5])
+        # shelters opening and closing
+        if rng.uniform() < 0.6:
+            for node in rng.choice(len(graph.node_ids), 2, replace=False).tolist():
+                shelters ^= {node}
+            if not shelters:
+                shelters.add(0)
+            mtime_ns += 1000
+            _write_shelters(path, graph, sorted(shelters), mtime_ns)
+        fields.refresh()
+
+        fresh = ShelterFields(graph, path)
+        fresh.refresh()
+        assert fields.counts["full"] == 1
+        assert fields.owner == fresh.owner, f"step {step}"
+        for a, b in zip(fields.cost, fresh.cost):
+            assert (math.isinf(a) and math.isinf(b)) or a == pytest.approx(b, rel=1e-9, abs=1e-9)
+        assert fields.time_s == pytest.approx(fresh.time_s, rel=1e-9, abs=1e-9)
+        assert fields.meters == pytest.approx(fresh.meters, rel=1e-9, abs=1e-9)
+    assert fields.counts["incremental"] > 0
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from spatial_index import GridIndex, haversine_km, wrap_lon
+
+
+def _points(seed, n=2000):
+    # spread over the whole globe, with clusters at the antimeridian and near both poles
+    rng = random.Random(seed)
+    points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(n)]
+    points += [(rng.uniform(-60, 60), rng.choice([-1, 1]) * rng.uniform(178, 180)) for _ in range(n // 4)]
+    points += [(rng.choice([-1, 1]) * rng.uniform(85, 90), rng.uniform(-180, 180)) for _ in range(n // 4)]
+    return points
+
+
+QUERIES = [
+    (31.6, -8.0, 50.0),
+    (0.0, 179.9, 300.0),
+    (-10.0, -179.5, 800.0),
+    (88.0, 20.0, 500.0),
+    (-89.5, -100.0, 200.0),
+    (60.0, 170.0, 2500.0),
+    (45.0, 0.0, 15000.0),
+    (10.0, 540.5, 400.0),
+]
+
+
+@pytest.mark.parametrize("lat,lon,radius_km", QUERIES)
+def test_within_radius_matches_brute_force(lat, lon, radius_km):
+    points = _points(0)
+    index = GridIndex(points, cell_deg=1.0)
+    expected = sorted(i for i, p in enumerate(points) if haversine_km(lat, lon, *p) <= radius_km)
+    found = index.within_radius(lat, lon, radius_km)
+    assert sorted(i for _, i in found) == expected
+    assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+@pytest.mark.parametrize("lat,lon,_", QUERIES)
+def test_nearest_matches_brute_force(lat, lon, _):
+    points = _points(1)
+    index = GridIndex(points, cell_deg=1.0)
+    expected = sorted((haversine_km(lat, lon, *p), i) for i, p in enumerate(points))[:10]
+    assert [i for _, i in index.nearest(lat, lon, 10)] == [i for _, i in expected]
+
+
+@pytest.mark.parametrize("box", [(-20, -30, 40, 60), (-40, 170, 40, -170), (80, -180, 90, 180)])
+def test_in_bbox_matches_brute_force(box):
+    min_lat, min_lon, max_lat, max_lon = box
+    points = _points(2)
+    index = GridIndex(points, cell_deg=1.0)
+
+    def inside(lat, lon):
+        lon = wrap_lon(lon)
+        in_lon = min_lon <= lon <= max_lon if min_lon <= max_lon else lon >= min_lon or lon <= max_lon
+        return min_lat <= lat <= max_lat and in_lon
+
+    assert index.in_bbox(*box) == [i for i, p in enumerate(points) if inside(*p)]
@@ -0,0 +1,163 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+
+# At most max_arenas arenas are kept, together never above max_total_bytes
+max_arenas = int(os.environ.get('ARENA_POOL_SIZE', '4'))
+max_total_bytes = int(os.environ.get('ARENA_MAX_BYTES', str(2 * 1024 ** 3)))
+
+_pool_lock = threading.Lock()
+_idle = []
+_arenas = []
+_overflows = 0
+
+
+class TensorArena(object):
+    """Reusable float32 buffers keyed by (tag, shape), least recently used ones are dropped above max_bytes.
+
+    Arenas are checked out of a small shared pool for the duration of one call (see checkout_arena), so
+    concurrent calls never share a buffer while consecutive calls of the same size reuse the same memory,
+    whichever thread runs them.
+    """
+    def __init__(self, max_bytes=max_total_bytes // max_arenas):
+        self.max_bytes = max_bytes
+        self.buffers = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, tag, shape):
+        key = (tag, tuple(shape))
+        buf = self.buffers.get(key)
+        if buf is not None:
+            self.hits += 1
+            self.buffers.move_to_end(key)
+            return buf
+        self.misses += 1
+        buf = torch.empty(shape, dtype=torch.float32)
+        self.buffers[key] = buf
+        self.bytes += buf.numel() * buf.element_size()
+        while self.bytes > self.max_bytes and len(self.buffers) > 1:
+            _, old = self.buffers.popitem(last=False)
+            self.bytes -= old.numel() * old.element_size()
+            self.evictions += 1
+        return buf
+
+    def get_numpy(self, tag, shape):
+        # numpy view sharing the tensor memory
+        return self.get(tag, shape).numpy()
+
+    def clear(self):
+        self.buffers.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {'buffers': len(self.buffers), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+@contextmanager
+def checkout_arena():
+    """An idle arena of the pool for the duration of the with block.
+
+    The pool grows up to max_arenas; past that, a call gets a throwaway arena freed when it is done, so
+    memory stays bounded by the pool however many threads (e.g. a web server's threadpool) call in.
+    """
+    global _overflows
+    with _pool_lock:
+        if _idle:
+            arena = _idle.pop()
+        elif len(_arenas) < max_arenas:
+            arena = TensorArena()
+            _arenas.append(arena)
+        else:
+            arena = None
+            _overflows += 1
+    if arena is None:
+        yield TensorArena()
+        return
+    try:
+        yield arena
+    finally:
+        with _pool_lock:
+            _idle.append(arena)
+
+
+def arena_stats():
+    # summed over the arenas of the pool
+    res = {'arenas': 0, 'idle': 0, 'buffers': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+    with _pool_lock:
+        res['idle'] = len(_idle)
+        res['overflows'] = _overflows
+        for arena in _arenas:
+            res['arenas'] += 1
+            for k, v in arena.stats().items():
+                res[k] += v
+    return res
+
+
+def _unflip(msk, t):
+    if t == 1:
+        return msk[:, ::-1, :]
+    if t == 2:
+        return msk[:, :, ::-1]
+    if t == 3:
+        return msk[:, ::-1, ::-1]
+    return msk
+
+
+def tta_predict(models, imgs, chunk, activation, arena=None):
+    """Flip TTA of the loc_*/cls_* functions with the input, TTA batch and accumulator taken from the arena.
+
+    imgs are concatenated along the channels (pre or pre + post), the 4 flips go through every model
+    chunk at a time. activation is 'sigmoid' (loc) or 'softmax' (cls, channel 0 turned into 1 - background).
+    Returns the averaged prediction as HxWxC uint8, computed exactly as the original per-member code.
+    """
+    if arena is None:
+        with checkout_arena() as arena:
+            return tta_predict(models, imgs, chunk, activation, arena)
+    imgs = [np.asarray(img) for img in imgs]
+    h, w = imgs[0].shape[:2]
+    c = sum(img.shape[2] for img in imgs)
+
+    with torch.no_grad():
+        x = arena.get_numpy('pre', (h, w, c))
+        i = 0
+        for img in imgs:
+            x[..., i:i + img.shape[2]] = img
+            i += img.shape[2]
+        x /= 127
+        x -= 1
+
+        inp = arena.get('tta', (4, c, h, w))
+        inp_np = inp.numpy()
+        inp_np[0] = x.transpose(2, 0, 1)
+        inp_np[1] = x[::-1, ...].transpose(2, 0, 1)
+        inp_np[2] = x[:, ::-1, ...].transpose(2, 0, 1)
+        inp_np[3] = x[::-1, ::-1, ...].transpose(2, 0, 1)
+
+        acc = None
+        n = 0
+        for model in models:
+            for j in range(0, 4, chunk):
+                msk = model(inp[j:j + chunk])
+                if activation == 'softmax':
+                    msk = torch.softmax(msk, dim=1)
+                else:
+                    msk = msk.sigmoid_()
+                msk = msk.cpu().numpy()
+                if activation == 'softmax':
+                    msk[:, 0, ...] = 1 - msk[:, 0, ...]
+                if acc is None:
+                    acc = arena.get_numpy('acc', msk.shape[1:])
+                    acc[...] = 0
+                for k in range(msk.shape[0]):
+                    acc += _unflip(msk[k], j + k)
+                    n += 1
+        acc /= n
+        acc *= 255
+    return acc.astype('uint8').transpose(1, 2, 0)
@@ -0,0 +1,46 @@
+import asyncio
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from fusion import fuse_predictions, damage_level, damage_level_name, building_damage
+
+
+def assess_damage(loaded, img, img2):
+    # full ensemble on one pair -> summary level and per-building damage
+    from ensemble import run_member
+
+    loc_preds = [run_member(m, models, img, img2) for m, models in loaded if m.kind == 'loc']
+    cls_preds = [run_member(m, models, img, img2) for m, models in loaded if m.kind == 'cls']
+    msk_loc, msk_dmg = fuse_predictions(cls_preds, loc_preds)
+    level = damage_level(msk_loc, msk_dmg)
+    return {'level': damage_level_name(level), 'level_index': level,
+            'buildings': building_damage(msk_loc, msk_dmg)}
+
+
+class CombinedAssessor(object):
+    """Disaster type and damage of one pair at the same time.
+
+    The Swin classifier runs on the batching thread of its SwinService, the damage ensemble on a pool of
+    damage_workers threads, so a request waits for the slower of the two instead of both. The pools only
+    bound how many calls run at once: torch's intra-op threads are process wide and both models share them.
+    """
+    def __init__(self, loaded, swin_service, damage_workers=1):
+        self.loaded = loaded
+        self.swin_service = swin_service
+        self.damage_pool = ThreadPoolExecutor(damage_workers)
+
+    async def _timed(self, awaitable):
+        t0 = timeit.default_timer()
+        res = await awaitable
+        return res, timeit.default_timer() - t0
+
+    async def assess(self, img, img2):
+        t0 = timeit.default_timer()
+        loop = asyncio.get_running_loop()
+        (types, swin_seconds), (damage, damage_seconds) = await asyncio.gather(
+            self._timed(asyncio.wrap_future(self.swin_service.classify(img2))),
+            self._timed(loop.run_in_executor(self.damage_pool, assess_damage, self.loaded, img, img2)))
+        res = {'type': types[0]['class'], 'type_predictions': types}
+        res.update(damage)
+        res['seconds'] = {'type': swin_seconds, 'damage': damage_seconds, 'total': timeit.default_timer() - t0}
+        return res
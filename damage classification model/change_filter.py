@@ -0,0 +1,162 @@
+"""Change-detection prefilter: tiles whose buildings look the same before and after are labelled undamaged
+without running the cls_* members.
+
+    python change_filter.py calibrate <val_dir> <cache_dir> <out_file> [max_fnr]
+
+calibrate uses the labelled validation set and the loc outputs cached by `select_ensemble.py cache` to report,
+for a sweep of thresholds, how many tiles would be skipped and the false-negative rate (damaged tiles skipped),
+and picks the largest threshold whose false-negative rate stays under max_fnr (0.01 by default).
+"""
+import os
+from os import path
+import sys
+import json
+import timeit
+
+import numpy as np
+import cv2
+
+from fusion import fuse_predictions
+from utils import load_image
+
+cv2.setNumThreads(0)
+cv2.ocl.setUseOpenCL(False)
+
+
+def structural_difference(img, img2, scale=0.25):
+    # 1 - SSIM of the downsampled grayscale pair, the post image is matched to the pre image's
+    # brightness and contrast first so global illumination changes do not count as change
+    g1 = cv2.cvtColor(cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY).astype('float32')
+    g2 = cv2.cvtColor(cv2.resize(img2, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY).astype('float32')
+    g2 = (g2 - g2.mean()) / (g2.std() + 1e-6) * g1.std() + g1.mean()
+
+    C1 = (0.01 * 255) ** 2
+    C2 = (0.03 * 255) ** 2
+    mu1 = cv2.GaussianBlur(g1, (7, 7), 1.5)
+    mu2 = cv2.GaussianBlur(g2, (7, 7), 1.5)
+    s11 = cv2.GaussianBlur(g1 * g1, (7, 7), 1.5) - mu1 * mu1
+    s22 = cv2.GaussianBlur(g2 * g2, (7, 7), 1.5) - mu2 * mu2
+    s12 = cv2.GaussianBlur(g1 * g2, (7, 7), 1.5) - mu1 * mu2
+    ssim = ((2 * mu1 * mu2 + C1) * (2 * s12 + C2)) / ((mu1 * mu1 + mu2 * mu2 + C1) * (s11 + s22 + C2))
+    return 1 - ssim
+
+
+def tile_scores(img, img2, loc_preds, tile=256, scale=0.25, building_thr=0.1):
+    # 90th percentile of the structural difference around the localized buildings of each tile,
+    # tiles without buildings score 0 since they can only be labelled background anyway
+    diff = structural_difference(img, img2, scale)
+    loc_p = np.asarray(loc_preds).astype('float').mean(axis=0) / 255
+    bld = cv2.dilate((loc_p > building_thr).astype('uint8'), np.ones((9, 9), np.uint8))
+    bld = cv2.resize(bld, (diff.shape[1], diff.shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+
+    h, w = loc_p.shape
+    fy = diff.shape[0] / h
+    fx = diff.shape[1] / w
+    scores = {}
+    for y in range(0, h, tile):
+        for x in range(0, w, tile):
+            box = (x, y, min(x + tile, w), min(y + tile, h))
+            sl = (slice(int(box[1] * fy), int(np.ceil(box[3] * fy))), slice(int(box[0] * fx), int(np.ceil(box[2] * fx))))
+            d = diff[sl][bld[sl]]
+            scores[box] = float(np.percentile(d, 90)) if d.size else 0.0
+    return scores
+
+
+def crop_box(box, w, h, margin):
+    x0, y0, x1, y1 = box
+    return max(0, x0 - margin), max(0, y0 - margin), min(w, x1 + margin), min(h, y1 + margin)
+
+
+def predict_with_prefilter(loaded, img, img2, thr, tile=256, margin=32, full_pass_ratio=0.9):
+    """Full ensemble prediction of one pair where cls members only run on changed tiles.
+
+    The changed tiles are run with a margin around them, so once their crops add up to full_pass_ratio of
+    the image (about 60% of the tiles changed with the defaults) a single full-image pass is cheaper and
+    is run instead.
+
+    loaded: list of (Member, models). Returns msk_loc, msk_dmg and the number of tiles / skipped tiles.
+    """
+    from progressive import run_members
+
+    h, w = img.shape[:2]
+    loc_preds, _ = run_members([(m, models) for m, models in loaded if m.kind == 'loc'], img, img2)
+    cls_loaded = [(m, models) for m, models in loaded if m.kind == 'cls']
+    scores = tile_scores(img, img2, loc_preds, tile)
+    changed = [box for box, s in scores.items() if s >= thr]
+
+    crops = [crop_box(box, w, h, margin) for box in changed]
+    crop_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in crops)
+
+    if len(changed) == len(scores) or crop_area >= full_pass_ratio * h * w:
+        _, cls_preds = run_members(cls_loaded, img, img2)
+        changed = list(scores)
+    else:
+        # unchanged tiles get a confident "no damage" from every member
+        undamaged = np.zeros((h, w, 5), dtype='uint8')
+        undamaged[..., 1] = 255
+        cls_preds = [undamaged.copy() for _ in cls_loaded]
+        for (x0, y0, x1, y1), (cx0, cy0, cx1, cy1) in zip(changed, crops):
+            _, cls_crop = run_members(cls_loaded, img[cy0:cy1, cx0:cx1], img2[cy0:cy1, cx0:cx1])
+            for msk, crop in zip(cls_preds, cls_crop):
+                msk[y0:y1, x0:x1] = crop[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+
+    msk_loc, msk_dmg = fuse_predictions(cls_preds, loc_preds)
+    return msk_loc, msk_dmg, {'tiles': len(scores), 'skipped': len(scores) - len(changed)}
+
+
+def calibrate(val_dir, cache_dir, out_file, max_fnr=0.01, tile=256):
+    from select_ensemble import list_pairs
+
+    with open(path.join(cache_dir, 'timings.json')) as f:
+        timings = json.load(f)
+    loc_names = [m for m in timings if timings[m]['kind'] == 'loc']
+
+    scores = []
+    damaged = []
+    damaged_px = []
+    for f in list_pairs(val_dir):
+        img = load_image(path.join(val_dir, 'images', f + '_pre_disaster.png'))
+        img2 = load_image(path.join(val_dir, 'images', f + '_post_disaster.png'))
+        loc_preds = [cv2.imread(path.join(cache_dir, m, f + '_part1.png'), cv2.IMREAD_UNCHANGED) for m in loc_names]
+        lbl_dmg = cv2.imread(path.join(val_dir, 'masks', f + '_post_disaster.png'), cv2.IMREAD_UNCHANGED)
+        for (x0, y0, x1, y1), s in tile_scores(img, img2, loc_preds, tile).items():
+            px = int((lbl_dmg[y0:y1, x0:x1] > 1).sum())
+            scores.append(s)
+            damaged.append(px > 0)
+            damaged_px.append(px)
+    scores = np.asarray(scores)
+    damaged = np.asarray(damaged)
+    damaged_px = np.asarray(damaged_px)
+
+    sweep = []
+    for thr in np.unique(np.percentile(scores, np.arange(0, 100, 2))):
+        skipped = scores < thr
+        sweep.append({
+            'threshold': float(thr),
+            'skip_rate': float(skipped.mean()),
+            'false_negative_rate': float((skipped & damaged).sum() / max(damaged.sum(), 1)),
+            'missed_damaged_pixels': float(damaged_px[skipped].sum() / max(damaged_px.sum(), 1)),
+        })
+    safe = [s for s in sweep if s['false_negative_rate'] <= max_fnr]
+    best = max(safe, key=lambda s: s['threshold']) if safe else None
+
+    print('{:>10}{:>10}{:>10}{:>10}'.format('thr', 'skip', 'fnr', 'missed'))
+    for s in sweep:
+        print('{:>10.4f}{:>10.3f}{:>10.4f}{:>10.4f}'.format(s['threshold'], s['skip_rate'], s['false_negative_rate'], s['missed_damaged_pixels']))
+    print('selected: {}'.format(best))
+
+    with open(out_file, 'w') as f:
+        json.dump({'tiles': len(scores), 'damaged_tiles': int(damaged.sum()), 'max_fnr': max_fnr, 'selected': best, 'sweep': sweep}, f, indent=2)
+    return best
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if len(sys.argv) > 4 and sys.argv[1] == 'calibrate':
+        calibrate(sys.argv[2], sys.argv[3], sys.argv[4], float(sys.argv[5]) if len(sys.argv) > 5 else 0.01)
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
@@ -13,7 +13,7 @@ random.seed(1)
 import timeit
 import cv2
 
-from skimage.morphology import square, dilation
+from fusion import fuse_predictions
 
 cv2.setNumThreads(0)
 cv2.ocl.setUseOpenCL(False)
@@ -23,8 +23,6 @@ pred_folders = ['dpn92cls_0_tuned', 'dpn92cls_1_tuned', 'dpn92cls_2_tuned', 'res
 
 loc_folders = ['pred50_loc_tuned', 'pred92_loc_tuned', 'pred34_loc', 'pred154_loc']
 
-_thr = [0.38, 0.13, 0.14]
-
 
 if __name__ == '__main__':
     t0 = timeit.default_timer()
@@ -44,24 +42,14 @@ if __name__ == '__main__':
         msk2 = cv2.imread(path.join(d, '{0}'.format(cls_fn + '_part2.png')), cv2.IMREAD_UNCHANGED)
         msk = np.concatenate([msk1, msk2[..., 1:]], axis=2)
         preds.append(msk)
-    preds = np.asarray(preds).astype('float').sum(axis=0) / len(pred_folders) / 255
-    
+
     loc_preds = []
     for d in loc_folders:
         msk = cv2.imread(path.join(d, loc_fn), cv2.IMREAD_UNCHANGED)
         loc_preds.append(msk)
-    loc_preds = np.asarray(loc_preds).astype('float').sum(axis=0) / len(loc_folders) / 255
-
-    msk_dmg = preds[..., 1:].argmax(axis=2) + 1
-    msk_loc = (1 * ((loc_preds > _thr[0]) | ((loc_preds > _thr[1]) & (msk_dmg > 1) & (msk_dmg < 4)) | ((loc_preds > _thr[2]) & (msk_dmg > 1)))).astype('uint8')
 
-    msk_dmg = msk_dmg * msk_loc
-    _msk = (msk_dmg == 2)
-    if _msk.sum() > 0:
-        _msk = dilation(_msk, square(5))
-        msk_dmg[_msk & msk_dmg == 1] = 2
+    msk_loc, msk_dmg = fuse_predictions(preds, loc_preds)
 
-    msk_dmg = msk_dmg.astype('uint8')
     cv2.imwrite(loc_pred_file, msk_loc, [cv2.IMWRITE_PNG_COMPRESSION, 9])
     cv2.imwrite(cls_pred_file, msk_dmg, [cv2.IMWRITE_PNG_COMPRESSION, 9])
 
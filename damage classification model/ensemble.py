@@ -0,0 +1,79 @@
+from os import path
+from collections import namedtuple
+
+import numpy as np
+import torch
+from torch import nn
+
+from zoo.models import Res34_Unet_Loc, SeResNext50_Unet_Loc, Dpn92_Unet_Loc, SeNet154_Unet_Loc
+from zoo.models import Res34_Unet_Double, SeResNext50_Unet_Double, Dpn92_Unet_Double, SeNet154_Unet_Double
+
+from predict34_loc import process_image_with_models
+from predict50_loc import loc_50
+from predict92_loc import loc_92
+from predict154_loc import loc_154
+from predict34cls import cls_34
+from predict50cls import cls_50
+from predict92cls import cls_92
+from predict154cls import cls_154
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+# name matches the prediction folders used by create_submission, snapshots are the weight files of the member
+Member = namedtuple('Member', ['name', 'kind', 'model_cls', 'predict', 'snapshots'])
+
+loc_members = [
+    Member('pred50_loc_tuned', 'loc', SeResNext50_Unet_Loc, loc_50, ['res50_loc_{}_tuned_best'.format(seed) for seed in [0, 1, 2]]),
+    Member('pred92_loc_tuned', 'loc', Dpn92_Unet_Loc, loc_92, ['dpn92_loc_{}_tuned_best'.format(seed) for seed in [0, 1, 2]]),
+    Member('pred34_loc', 'loc', Res34_Unet_Loc, process_image_with_models, ['res34_loc_{}_1_best'.format(seed) for seed in [0, 1, 2]]),
+    Member('pred154_loc', 'loc', SeNet154_Unet_Loc, loc_154, ['se154_loc_{}_1_best'.format(seed) for seed in [0, 1, 2]]),
+]
+
+cls_members = [Member('dpn92cls_{}_tuned'.format(seed), 'cls', Dpn92_Unet_Double, cls_92, ['dpn92_cls_cce_{}_tuned_best'.format(seed)]) for seed in [0, 1, 2]] \
+    + [Member('res34cls2_{}_tuned'.format(seed), 'cls', Res34_Unet_Double, cls_34, ['res34_cls2_{}_tuned_best'.format(seed)]) for seed in [0, 1, 2]] \
+    + [Member('res50cls_{}_tuned'.format(seed), 'cls', SeResNext50_Unet_Double, cls_50, ['res50_cls_cce_{}_tuned_best'.format(seed)]) for seed in [0, 1, 2]] \
+    + [Member('se154cls_{}_tuned'.format(seed), 'cls', SeNet154_Unet_Double, cls_154, ['se154_cls_cce_{}_tuned_best'.format(seed)]) for seed in [0, 1, 2]]
+
+members = loc_members + cls_members
+
+
+def get_member(name):
+    for m in members:
+        if m.name == name:
+            return m
+    raise KeyError('Unknown ensemble member: {}'.format(name))
+
+
+def load_snapshot(model_cls, snap_to_load):
+    model = model_cls(pretrained=None)
+    model = nn.DataParallel(model).to(device)
+    print("=> loading checkpoint '{}'".format(snap_to_load))
+    checkpoint = torch.load(snap_to_load, map_location=device)
+    loaded_dict = checkpoint['state_dict']
+    sd = model.state_dict()
+    for k in model.state_dict():
+        if k in loaded_dict and sd[k].size() == loaded_dict[k].size():
+            sd[k] = loaded_dict[k]
+    model.load_state_dict(sd)
+    model.eval()
+    return model
+
+
+def load_member(member, weights_dir):
+    return [load_snapshot(member.model_cls, path.join(weights_dir, snap)) for snap in member.snapshots]
+
+
+def run_member(member, models, img, img2):
+    # loc members return HxW, cls members HxWx5 - the layouts fuse_predictions expects
+    if member.kind == 'loc':
+        return member.predict(models, img)[..., 0]
+    return member.predict(models, img, img2)
+
+
+def split_parts(msk):
+    # HxWx5 cls output -> the two 3 channel pngs written by the prediction scripts
+    return msk[..., :3], msk[..., 2:]
+
+
+def join_parts(msk1, msk2):
+    return np.concatenate([msk1, msk2[..., 1:]], axis=2)
@@ -0,0 +1,91 @@
+import numpy as np
+import cv2
+
+from skimage.morphology import square, dilation
+
+_thr = [0.38, 0.13, 0.14]
+
+
+def fuse_predictions(cls_preds, loc_preds):
+    # cls_preds: list of HxWx5 uint8 masks (part1 + part2[..., 1:]), loc_preds: list of HxW uint8 masks
+    preds = np.asarray(cls_preds).astype('float').sum(axis=0) / len(cls_preds) / 255
+    loc_preds = np.asarray(loc_preds).astype('float').sum(axis=0) / len(loc_preds) / 255
+
+    msk_dmg = preds[..., 1:].argmax(axis=2) + 1
+    msk_loc = (1 * ((loc_preds > _thr[0]) | ((loc_preds > _thr[1]) & (msk_dmg > 1) & (msk_dmg < 4)) | ((loc_preds > _thr[2]) & (msk_dmg > 1)))).astype('uint8')
+
+    msk_dmg = msk_dmg * msk_loc
+    _msk = (msk_dmg == 2)
+    if _msk.sum() > 0:
+        _msk = dilation(_msk, square(5))
+        msk_dmg[_msk & msk_dmg == 1] = 2
+
+    msk_dmg = msk_dmg.astype('uint8')
+    return msk_loc, msk_dmg
+
+
+def score_counts(msk_loc, msk_dmg, lbl_loc, lbl_dmg):
+    # tp/fp/fn for localization followed by tp/fp/fn of damage classes 1..4, counted on labelled buildings only
+    counts = np.zeros((5, 3), dtype='int64')
+    lbl_loc = lbl_loc > 0
+    msk_loc = msk_loc > 0
+    counts[0] = [(msk_loc & lbl_loc).sum(), (msk_loc & ~lbl_loc).sum(), (~msk_loc & lbl_loc).sum()]
+    pred = msk_dmg[lbl_dmg > 0]
+    targ = lbl_dmg[lbl_dmg > 0]
+    for c in range(1, 5):
+        counts[c] = [((pred == c) & (targ == c)).sum(), ((pred == c) & (targ != c)).sum(), ((pred != c) & (targ == c)).sum()]
+    return counts
+
+
+def xview2_score(counts):
+    # 0.3 * localization F1 + 0.7 * harmonic mean of the per-class damage F1
+    f1s = []
+    for tp, fp, fn in counts:
+        f1s.append(2 * tp / (2 * tp + fp + fn) if tp > 0 else 0)
+    loc_f1 = f1s[0]
+    dmg_f1 = len(f1s[1:]) / np.sum([1 / (f + 1e-6) for f in f1s[1:]])
+    return 0.3 * loc_f1 + 0.7 * dmg_f1, loc_f1, dmg_f1, f1s[1:]
+
+
+damage_levels = ["no damage", "minor damage", "major damage", "destroyed"]
+no_buildings = "no buildings"
+
+
+def damage_level_name(level):
+    # damage_level() and the building classes are 1-based (1 = no damage), 0 means nothing was localized
+    return damage_levels[level - 1] if level >= 1 else no_buildings
+
+
+def damage_level(msk_loc, msk_dmg):
+    # summary level of a pair from the mean damage class of the localized pixels, as predict_level_ofdamage
+    mask = (msk_loc == 1) & (msk_dmg >= 1) & (msk_dmg <= 4)
+    localized_damage_values = msk_dmg[mask]
+    if len(localized_damage_values) > 0:
+        average_damage = np.mean(localized_damage_values)
+    else:
+        average_damage = 0
+    if average_damage > 0 and average_damage <= 1.15:
+        return 1
+    elif average_damage > 1.15 and average_damage <= 2.15:
+        return 2
+    elif average_damage > 2.15 and average_damage <= 3.15:
+        return 3
+    elif average_damage > 3.15 and average_damage <= 4:
+        return 4
+    return 0
+
+
+def building_damage(msk_loc, msk_dmg, min_area=10):
+    # one record per connected building of msk_loc, damage is the most frequent class 1..4 of its pixels
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(msk_loc, connectivity=8)
+    res = []
+    for i in range(1, n):
+        x, y, w, h, area = [int(v) for v in stats[i]]
+        if area < min_area:
+            continue
+        comp = labels[y:y + h, x:x + w] == i
+        cls = int(np.bincount(msk_dmg[y:y + h, x:x + w][comp], minlength=5)[1:].argmax()) + 1
+        contours, _ = cv2.findContours(comp.astype('uint8'), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        polygon = (max(contours, key=cv2.contourArea)[:, 0] + [x, y]).tolist()
+        res.append({'id': len(res), 'bbox': [x, y, w, h], 'area': area, 'damage': cls, 'damage_name': damage_level_name(cls), 'polygon': polygon})
+    return res
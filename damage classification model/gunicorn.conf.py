@@ -0,0 +1,17 @@
+# gunicorn -c gunicorn.conf.py serve:app
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WORKERS', 2))
+worker_class = 'uvicorn.workers.UvicornWorker'
+# serve.py loads the ensemble at import, in the master, so the workers inherit the shared weights
+preload_app = True
+# the first requests of a worker run the big models on cold caches
+timeout = 600
+
+
+def post_fork(server, worker):
+    # split the cores between the workers instead of every worker using all of them
+    import torch
+    torch.set_num_threads(max(1, multiprocessing.cpu_count() // workers))
@@ -0,0 +1,55 @@
+"""Import time of the serving path.
+
+    python import_report.py [modules=ensemble,fusion,ingest,arena] [top=15]
+
+Every module is imported in a fresh interpreter with -X importtime, the report lists the total and the
+slowest imports by cumulative time, and exits with status 1 when a module that inference does not need
+(training, plotting or tunnelling libraries) got imported along the way.
+"""
+import sys
+import subprocess
+import timeit
+
+unwanted = ['pandas', 'tqdm', 'matplotlib', 'seaborn', 'pyngrok', 'torch.optim.lr_scheduler', 'skimage.io']
+
+
+def import_times(module):
+    # (self us, cumulative us, name) for every module imported by `import module`
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError('import {} failed:\n{}'.format(module, proc.stderr.strip().splitlines()[-1]))
+    res = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        res.append((int(self_us), int(cumulative_us), name.strip()))
+    return res
+
+
+def report(module, top=15):
+    times = import_times(module)
+    names = set(name for _, _, name in times)
+    total = max(cumulative for _, cumulative, _ in times) if times else 0
+    print('{}: {:.2f} s, {} modules'.format(module, total / 1e6, len(times)))
+    for _, cumulative, name in sorted(times, reverse=True, key=lambda t: t[1])[:top]:
+        print('  {:>8.3f} s  {}'.format(cumulative / 1e6, name))
+    found = [m for m in unwanted if m in names]
+    if found:
+        print('  unneeded imports: {}'.format(', '.join(found)))
+    return found
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    opts = dict(arg.split('=') for arg in sys.argv[1:])
+    modules = opts.get('modules', 'ensemble,fusion,ingest,arena').split(',')
+    found = []
+    for module in modules:
+        found += report(module, int(opts.get('top', 15)))
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
+    if found:
+        sys.exit(1)
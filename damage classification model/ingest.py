@@ -0,0 +1,62 @@
+from io import BytesIO
+
+import numpy as np
+import cv2
+from PIL import Image
+
+max_upload_bytes = 64 * 1024 * 1024
+max_side = 4096
+
+_signatures = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'BM', 'bmp'),
+]
+
+
+def sniff_format(data):
+    for sig, fmt in _signatures:
+        if data.startswith(sig):
+            return fmt
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def decode_image(data, max_bytes=max_upload_bytes, max_side=max_side):
+    """Decodes uploaded image bytes into a contiguous HxWx3 uint8 RGB array without touching the disk.
+
+    The format is sniffed from the magic bytes and the dimensions are read from the header before
+    anything is decoded, so oversized or bogus uploads are rejected with a ValueError up front.
+    """
+    if len(data) == 0:
+        raise ValueError('empty upload')
+    if len(data) > max_bytes:
+        raise ValueError('upload is larger than {} bytes'.format(max_bytes))
+    fmt = sniff_format(data)
+    if fmt is None:
+        raise ValueError('unsupported image format')
+
+    # PIL only parses the header here
+    try:
+        w, h = Image.open(BytesIO(data)).size
+    except OSError:
+        # UnidentifiedImageError is an OSError too: right magic bytes, unreadable header
+        raise ValueError('can not read image header')
+    if w > max_side or h > max_side:
+        raise ValueError('image is {}x{}, at most {}x{} is supported'.format(w, h, max_side, max_side))
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('can not decode {} image'.format(fmt))
+    # in place, RGB like the PIL images the models were given so far
+    cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+    return img
+
+
+async def read_upload(file, max_bytes=max_upload_bytes, max_side=max_side):
+    # reads at most max_bytes + 1 so an oversized upload is never fully buffered
+    data = await file.read(max_bytes + 1)
+    return decode_image(data, max_bytes, max_side), data
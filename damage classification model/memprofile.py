@@ -0,0 +1,202 @@
+"""Peak memory of the ensemble members per TTA chunk size and input size.
+
+    python memprofile.py profile <out_file> [sizes=512,1024] [chunks=1,2,4] [members=pred34_loc,se154cls_0_tuned]
+    python memprofile.py check <budgets_file>
+
+Every configuration runs in a fresh process (randomly initialized weights, they take the same memory as the
+checkpoints) so its peak RSS is not hidden by what earlier configurations left in the allocator. Besides
+the overall peak, the peak RSS and the size of the activations produced are recorded per encoder/decoder stage.
+
+<budgets_file> is a json list of {"member": ..., "size": ..., "chunk": ..., "max_rss_mb": ...}; check exits
+with status 1 when any configuration needs more than its budget, so it can guard container sizes in CI.
+"""
+import os
+import sys
+import json
+import timeit
+import threading
+import resource
+import multiprocessing
+import queue
+
+_page_size = os.sysconf('SC_PAGE_SIZE')
+
+
+def current_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * _page_size
+
+
+def _tensor_bytes(out):
+    if isinstance(out, (tuple, list)):
+        return sum(_tensor_bytes(o) for o in out)
+    if hasattr(out, 'element_size'):
+        return out.numel() * out.element_size()
+    return 0
+
+
+class StageMonitor(object):
+    # samples RSS in the background and attributes it to the top level module that is running
+    def __init__(self, model, interval=0.002):
+        self.interval = interval
+        self.stage = 'other'
+        self.rss = {}
+        self.activations = {}
+        self.handles = []
+        for name, module in model.named_children():
+            self.handles.append(module.register_forward_pre_hook(self._enter(name)))
+            self.handles.append(module.register_forward_hook(self._exit(name)))
+
+    def _enter(self, name):
+        def hook(module, inp):
+            self.stage = name
+        return hook
+
+    def _exit(self, name):
+        def hook(module, inp, out):
+            self._sample()
+            self.activations[name] = max(self.activations.get(name, 0), _tensor_bytes(out))
+            self.stage = 'other'
+        return hook
+
+    def _sample(self):
+        rss = current_rss()
+        if rss > self.rss.get(self.stage, 0):
+            self.rss[self.stage] = rss
+
+    def _run(self):
+        while not self.done.is_set():
+            self._sample()
+            self.done.wait(self.interval)
+
+    def __enter__(self):
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.done.set()
+        self.thread.join()
+        for h in self.handles:
+            h.remove()
+
+
+def profile_config(member_name, size, chunk):
+    import numpy as np
+    import torch
+    from ensemble import get_member
+    from arena import tta_predict
+
+    torch.manual_seed(0)
+    member = get_member(member_name)
+    rss0 = current_rss()
+    models = [member.model_cls(pretrained=None).eval() for _ in member.snapshots]
+    rss_weights = current_rss()
+
+    img = np.random.randint(0, 256, (size, size, 3), dtype='uint8')
+    imgs = [img] if member.kind == 'loc' else [img, img]
+    activation = 'sigmoid' if member.kind == 'loc' else 'softmax'
+    t0 = timeit.default_timer()
+    with StageMonitor(models[0]) as monitor:
+        tta_predict(models, imgs, chunk, activation)
+    elapsed = timeit.default_timer() - t0
+
+    mb = 1024 ** 2
+    return {
+        'member': member_name,
+        'size': size,
+        'chunk': chunk,
+        'seconds': elapsed,
+        'weights_mb': (rss_weights - rss0) / mb,
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stage_peak_rss_mb': {k: v / mb for k, v in monitor.rss.items()},
+        'stage_activation_mb': {k: v / mb for k, v in monitor.activations.items()},
+    }
+
+
+def _child(args, q):
+    try:
+        q.put(profile_config(*args))
+    except Exception as e:
+        q.put({'member': args[0], 'size': args[1], 'chunk': args[2], 'error': str(e)})
+
+
+def run_isolated(member_name, size, chunk):
+    ctx = multiprocessing.get_context('spawn')
+    q = ctx.Queue()
+    p = ctx.Process(target=_child, args=((member_name, size, chunk), q))
+    p.start()
+    # polled, a child that is OOM-killed or crashes never puts a result and q.get() would wait forever
+    res = None
+    while res is None:
+        try:
+            res = q.get(timeout=1)
+        except queue.Empty:
+            if not p.is_alive():
+                try:
+                    # whatever it put just before exiting may still be in flight
+                    res = q.get(timeout=1)
+                except queue.Empty:
+                    break
+    p.join()
+    if res is None:
+        return {'member': member_name, 'size': size, 'chunk': chunk, 'error': 'exit code {}'.format(p.exitcode)}
+    if p.exitcode != 0 and 'error' not in res:
+        res['error'] = 'exit code {}'.format(p.exitcode)
+    return res
+
+
+def profile(out_file, sizes, chunks, member_names):
+    res = []
+    for name in member_names:
+        for size in sizes:
+            for chunk in chunks:
+                r = run_isolated(name, size, chunk)
+                res.append(r)
+                if 'error' in r:
+                    print('{} {} chunk {}: {}'.format(name, size, chunk, r['error']))
+                else:
+                    print('{} {} chunk {}: peak {:.0f} MB, weights {:.0f} MB, {:.1f} s'.format(name, size, chunk, r['peak_rss_mb'], r['weights_mb'], r['seconds']))
+    with open(out_file, 'w') as f:
+        json.dump(res, f, indent=2)
+    return res
+
+
+def check(budgets_file):
+    with open(budgets_file) as f:
+        budgets = json.load(f)
+    failed = []
+    for b in budgets:
+        r = run_isolated(b['member'], b['size'], b['chunk'])
+        if 'error' in r or r['peak_rss_mb'] > b['max_rss_mb']:
+            failed.append((b, r))
+            print('FAIL {} {} chunk {}: {} MB > {} MB budget'.format(b['member'], b['size'], b['chunk'], r.get('peak_rss_mb', r.get('error')), b['max_rss_mb']))
+        else:
+            print('ok   {} {} chunk {}: {:.0f} MB <= {} MB budget'.format(b['member'], b['size'], b['chunk'], r['peak_rss_mb'], b['max_rss_mb']))
+    return len(failed) == 0
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'profile':
+        opts = dict(arg.split('=') for arg in sys.argv[3:])
+        sizes = [int(v) for v in opts.get('sizes', '512,1024').split(',')]
+        chunks = [int(v) for v in opts.get('chunks', '1,2,4').split(',')]
+        if 'members' in opts:
+            member_names = opts['members'].split(',')
+        else:
+            from ensemble import members
+            member_names = [m.name for m in members]
+        profile(sys.argv[2], sizes, chunks, member_names)
+    elif len(sys.argv) > 2 and sys.argv[1] == 'check':
+        ok = check(sys.argv[2])
+        if not ok:
+            sys.exit(1)
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
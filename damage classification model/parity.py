@@ -0,0 +1,283 @@
+"""Golden-output parity of alternative inference paths against the loc_*/cls_* + create_submission reference.
+
+    python parity.py reference <ref_dir> [pairs=4] [size=256] [seed=0] [members=pred34_loc,res34cls2_0_tuned]
+    python parity.py compare <ref_dir> <backend> [out=<report.json>] [min_agreement=0.999] [max_prob_error=0.01] [thr=0.1]
+
+Everything runs offline on CPU: the pairs are synthetic (seeded rectangles on a noise background, part of them
+damaged in the post image) and every snapshot is a randomly initialized model with a seed derived from its
+position in the ensemble, so compare rebuilds exactly the weights reference used. reference stores the pairs,
+the averaged member probabilities and the fused masks in <ref_dir>.
+
+The reference is the original per-member code (float64 flip batch, DPN stages as plain nn.Sequential),
+pinned in this file; 'optimized' runs the same members through ensemble.run_member (arena TTA, DPN dense
+buffer). <backend> is one of the built-in paths below or module:function for any other one. A backend is
+called as fn(loaded, img, img2) with loaded the (Member, models) list and returns a dict with msk_loc and msk_dmg, and
+optionally loc_preds / cls_preds (member outputs as uint8, the layout fuse_predictions takes) from which the
+probability error is computed. compare exits with status 1 when a gate given on the command line is missed.
+"""
+import os
+from os import path, makedirs
+import sys
+import json
+import timeit
+import importlib
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+from torch import nn
+
+from fusion import fuse_predictions, score_counts, xview2_score
+from utils import preprocess_inputs
+
+
+def synthetic_pair(seed, size=256, buildings=12):
+    # pre / post image with building and damage labels, damaged buildings get darker and noisier
+    rng = np.random.RandomState(seed)
+    img = rng.randint(60, 140, (size, size, 3)).astype('uint8')
+    lbl_loc = np.zeros((size, size), dtype='uint8')
+    lbl_dmg = np.zeros((size, size), dtype='uint8')
+    img2 = img.copy()
+    for _ in range(buildings):
+        bh, bw = rng.randint(8, size // 6, 2)
+        y, x = rng.randint(0, size - bh), rng.randint(0, size - bw)
+        color = rng.randint(150, 255, 3)
+        img[y:y + bh, x:x + bw] = color
+        cls = rng.randint(1, 5)
+        post = color * (1 - 0.2 * (cls - 1))
+        noise = rng.randint(0, 1 + 30 * (cls - 1), (bh, bw, 3))
+        img2[y:y + bh, x:x + bw] = np.clip(post + noise, 0, 255)
+        lbl_loc[y:y + bh, x:x + bw] = 1
+        lbl_dmg[y:y + bh, x:x + bw] = cls
+    return img, img2, lbl_loc, lbl_dmg
+
+
+def seeded_members(seed, member_names=None):
+    from ensemble import members
+
+    loaded = []
+    for i, member in enumerate(members):
+        if member_names is not None and member.name not in member_names:
+            continue
+        models = []
+        for j, _ in enumerate(member.snapshots):
+            torch.manual_seed(seed * 1000 + i * 10 + j)
+            model = nn.DataParallel(member.model_cls(pretrained=None))
+            model.eval()
+            models.append(model)
+        loaded.append((member, models))
+    return loaded
+
+
+# TTA chunk and activation of the original loc_*/cls_* functions, by function name
+baseline_tta = {
+    'process_image_with_models': (2, 'sigmoid'),
+    'loc_50': (2, 'sigmoid'),
+    'loc_92': (4, 'sigmoid'),
+    'loc_154': (4, 'sigmoid'),
+    'cls_34': (2, 'sigmoid'),
+    'cls_50': (2, 'softmax'),
+    'cls_92': (1, 'softmax'),
+    'cls_154': (1, 'softmax'),
+}
+
+
+@contextmanager
+def sequential_dpn():
+    # DPN stages without the preallocated dense buffer, as the original zoo code ran them
+    from zoo.dpn import DualPathStage
+    DualPathStage.use_buffer = False
+    try:
+        yield
+    finally:
+        DualPathStage.use_buffer = True
+
+
+def baseline_predict(member, models, img, img2):
+    """The original per-member code: float64 flip batch, chunked forward, mean of the unflipped outputs.
+
+    Kept here verbatim rather than going through run_member, so the reference does not move when the
+    optimized paths (arena, DPN dense buffer) do.
+    """
+    chunk, activation = baseline_tta[member.predict.__name__]
+    with torch.no_grad():
+        if member.kind == 'cls':
+            img = np.concatenate([img, img2], axis=2)
+        img = preprocess_inputs(img)
+        inp = [img, img[::-1, ...], img[:, ::-1, ...], img[::-1, ::-1, ...]]
+        inp = np.asarray(inp, dtype='float')
+        inp = torch.from_numpy(inp.transpose((0, 3, 1, 2))).float()
+        pred = []
+        for model in models:
+            for j in range(0, 4, chunk):
+                msk = model(inp[j:j + chunk])
+                if activation == 'softmax':
+                    msk = torch.softmax(msk[:, :, ...], dim=1)
+                else:
+                    msk = torch.sigmoid(msk)
+                msk = msk.cpu().numpy()
+                if activation == 'softmax':
+                    msk[:, 0, ...] = 1 - msk[:, 0, ...]
+                for k in range(msk.shape[0]):
+                    t = j + k
+                    if t == 0:
+                        pred.append(msk[k, ...])
+                    elif t == 1:
+                        pred.append(msk[k, :, ::-1, :])
+                    elif t == 2:
+                        pred.append(msk[k, :, :, ::-1])
+                    else:
+                        pred.append(msk[k, :, ::-1, ::-1])
+        pred_full = np.asarray(pred).mean(axis=0)
+        msk = pred_full * 255
+        msk = msk.astype('uint8').transpose(1, 2, 0)
+    return msk
+
+
+def reference_backend(loaded, img, img2):
+    with sequential_dpn():
+        loc_preds = [baseline_predict(m, models, img, img2)[..., 0] for m, models in loaded if m.kind == 'loc']
+        cls_preds = [baseline_predict(m, models, img, img2) for m, models in loaded if m.kind == 'cls']
+    msk_loc, msk_dmg = fuse_predictions(cls_preds, loc_preds)
+    return {'msk_loc': msk_loc, 'msk_dmg': msk_dmg, 'loc_preds': loc_preds, 'cls_preds': cls_preds}
+
+
+def optimized_backend(loaded, img, img2):
+    from ensemble import run_member
+
+    loc_preds = [run_member(m, models, img, img2) for m, models in loaded if m.kind == 'loc']
+    cls_preds = [run_member(m, models, img, img2) for m, models in loaded if m.kind == 'cls']
+    msk_loc, msk_dmg = fuse_predictions(cls_preds, loc_preds)
+    return {'msk_loc': msk_loc, 'msk_dmg': msk_dmg, 'loc_preds': loc_preds, 'cls_preds': cls_preds}
+
+
+def prefilter_backend(thr):
+    def fn(loaded, img, img2):
+        from change_filter import predict_with_prefilter
+        msk_loc, msk_dmg, _ = predict_with_prefilter(loaded, img, img2, thr)
+        return {'msk_loc': msk_loc, 'msk_dmg': msk_dmg}
+    return fn
+
+
+def progressive_backend(loaded, img, img2):
+    from progressive import progressive_predict
+    for event in progressive_predict(loaded, img, img2):
+        pass
+    return {'msk_loc': event['msk_loc'], 'msk_dmg': event['msk_dmg']}
+
+
+def get_backend(name, opts):
+    if name == 'reference':
+        return reference_backend
+    if name == 'optimized':
+        return optimized_backend
+    if name == 'prefilter':
+        return prefilter_backend(float(opts.get('thr', 0.1)))
+    if name == 'progressive':
+        return progressive_backend
+    module, fn = name.split(':')
+    return getattr(importlib.import_module(module), fn)
+
+
+def _probs(loc_preds, cls_preds):
+    return np.asarray(loc_preds).astype('float32').mean(axis=0) / 255, np.asarray(cls_preds).astype('float32').mean(axis=0) / 255
+
+
+def make_reference(ref_dir, pairs=4, size=256, seed=0, member_names=None):
+    makedirs(ref_dir, exist_ok=True)
+    loaded = seeded_members(seed, member_names)
+    for i in range(pairs):
+        img, img2, lbl_loc, lbl_dmg = synthetic_pair(seed * 1000 + i, size)
+        res = reference_backend(loaded, img, img2)
+        loc_prob, dmg_prob = _probs(res['loc_preds'], res['cls_preds'])
+        np.savez_compressed(path.join(ref_dir, 'pair_{}.npz'.format(i)), img=img, img2=img2, lbl_loc=lbl_loc, lbl_dmg=lbl_dmg,
+                            loc_prob=loc_prob, dmg_prob=dmg_prob, msk_loc=res['msk_loc'], msk_dmg=res['msk_dmg'])
+        print('pair {}: {} building pixels in the reference'.format(i, int(res['msk_loc'].sum())))
+    meta = {'pairs': pairs, 'size': size, 'seed': seed, 'members': [m.name for m, _ in loaded], 'torch': torch.__version__}
+    with open(path.join(ref_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def compare(ref_dir, backend, opts=None):
+    """Runs backend on the stored pairs and reports its agreement with the reference.
+
+    Per-class F1 is computed with the reference masks as the labels, so 1.0 means identical and the deltas
+    are f1 - 1. The probability error is the largest absolute difference of the averaged member
+    probabilities, only for backends that return member outputs.
+    """
+    opts = opts or {}
+    with open(path.join(ref_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    loaded = seeded_members(meta['seed'], meta['members'])
+    fn = get_backend(backend, opts)
+
+    counts = np.zeros((5, 3), dtype='int64')
+    loc_agree = dmg_agree = pixels = 0
+    max_prob_error = None
+    seconds = 0.0
+    for i in range(meta['pairs']):
+        ref = np.load(path.join(ref_dir, 'pair_{}.npz'.format(i)))
+        t0 = timeit.default_timer()
+        res = fn(loaded, ref['img'], ref['img2'])
+        seconds += timeit.default_timer() - t0
+        loc_agree += (res['msk_loc'] == ref['msk_loc']).sum()
+        dmg_agree += (res['msk_dmg'] == ref['msk_dmg']).sum()
+        pixels += ref['msk_loc'].size
+        counts += score_counts(res['msk_loc'], res['msk_dmg'], ref['msk_loc'], ref['msk_dmg'])
+        if 'loc_preds' in res:
+            loc_prob, dmg_prob = _probs(res['loc_preds'], res['cls_preds'])
+            err = max(np.abs(loc_prob - ref['loc_prob']).max(), np.abs(dmg_prob - ref['dmg_prob']).max())
+            max_prob_error = float(err) if max_prob_error is None else max(max_prob_error, float(err))
+
+    _, loc_f1, _, dmg_f1s = xview2_score(counts)
+    # a class missing from both reference and backend is in agreement
+    f1s = [f if tp + fp + fn > 0 else 1.0 for f, (tp, fp, fn) in zip([loc_f1] + list(dmg_f1s), counts)]
+    report = {
+        'backend': backend,
+        'pairs': meta['pairs'],
+        'seconds': seconds,
+        'loc_agreement': loc_agree / pixels,
+        'dmg_agreement': dmg_agree / pixels,
+        'f1_delta': {k: f - 1 for k, f in zip(['localization', 'no damage', 'minor damage', 'major damage', 'destroyed'], f1s)},
+        'max_prob_error': max_prob_error,
+    }
+    return report
+
+
+def check_gates(report, opts):
+    ok = True
+    if 'min_agreement' in opts:
+        ok &= min(report['loc_agreement'], report['dmg_agreement']) >= float(opts['min_agreement'])
+    if 'max_prob_error' in opts:
+        # a backend without member outputs can not show it meets the gate
+        if report['max_prob_error'] is None:
+            print('max_prob_error gate requested but {} returns no member outputs'.format(report['backend']))
+            ok = False
+        else:
+            ok &= report['max_prob_error'] <= float(opts['max_prob_error'])
+    return ok
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'reference':
+        opts = dict(arg.split('=') for arg in sys.argv[3:])
+        member_names = opts['members'].split(',') if 'members' in opts else None
+        make_reference(sys.argv[2], int(opts.get('pairs', 4)), int(opts.get('size', 256)), int(opts.get('seed', 0)), member_names)
+    elif len(sys.argv) > 3 and sys.argv[1] == 'compare':
+        opts = dict(arg.split('=') for arg in sys.argv[4:])
+        report = compare(sys.argv[2], sys.argv[3], opts)
+        print(json.dumps(report, indent=2))
+        if 'out' in opts:
+            with open(opts['out'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if not check_gates(report, opts):
+            print('parity gates failed')
+            sys.exit(1)
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
@@ -0,0 +1,146 @@
+import threading
+import queue
+import timeit
+
+_STOP = object()
+
+
+class Stage(object):
+    def __init__(self, name, fn, workers=1):
+        # fn(item) -> item for the next stage, or None to drop it
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.alive = self.workers
+
+
+class Pipeline(object):
+    """Stages connected by bounded queues, each stage served by its own pool of worker threads.
+
+    A full queue blocks the stage feeding it, so a slow stage throttles everything upstream instead of
+    letting decoded images pile up in memory. numpy, cv2 and torch release the GIL in their heavy calls,
+    so I/O, pre/post-processing and the forward passes of different items overlap.
+    """
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def start(self):
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.threads = []
+        for i, stage in enumerate(self.stages):
+            stage.reset()
+            for _ in range(stage.workers):
+                t = threading.Thread(target=self._work, args=(i,), daemon=True)
+                t.start()
+                self.threads.append(t)
+        self.t0 = timeit.default_timer()
+        self.t1 = None
+
+    def put(self, item):
+        # blocks while the first stage is saturated
+        self.queues[0].put(item)
+
+    def close(self):
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(_STOP)
+
+    def results(self):
+        while True:
+            item = self.queues[-1].get()
+            if item is _STOP:
+                self.t1 = timeit.default_timer()
+                return
+            yield item
+
+    def join(self):
+        for t in self.threads:
+            t.join()
+
+    def run(self, items):
+        self.start()
+
+        def feed():
+            for item in items:
+                self.put(item)
+            self.close()
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        res = list(self.results())
+        feeder.join()
+        self.join()
+        return res
+
+    def _work(self, i):
+        stage = self.stages[i]
+        q_in = self.queues[i]
+        q_out = self.queues[i + 1]
+        while True:
+            item = q_in.get()
+            if item is _STOP:
+                break
+            t0 = timeit.default_timer()
+            try:
+                out = stage.fn(item)
+            except Exception as e:
+                print('Error in stage {}: {}'.format(stage.name, e))
+                out = None
+                with stage.lock:
+                    stage.errors += 1
+            with stage.lock:
+                stage.busy += timeit.default_timer() - t0
+                stage.items += 1
+            if out is not None:
+                q_out.put(out)
+
+        with stage.lock:
+            stage.alive -= 1
+            last = stage.alive == 0
+        if last:
+            # the last worker of a stage shuts down the next one
+            n = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            for _ in range(n):
+                q_out.put(_STOP)
+
+    def stats(self):
+        elapsed = (self.t1 or timeit.default_timer()) - self.t0
+        res = []
+        for stage in self.stages:
+            res.append({
+                'stage': stage.name,
+                'workers': stage.workers,
+                'items': stage.items,
+                'errors': stage.errors,
+                'busy_seconds': stage.busy,
+                'seconds_per_item': stage.busy / max(stage.items, 1),
+                'items_per_second': stage.items / elapsed if elapsed > 0 else 0,
+                # fraction of the stage's worker time spent working, the bottleneck is close to 1
+                'utilization': stage.busy / (elapsed * stage.workers) if elapsed > 0 else 0,
+            })
+        return res
+
+    def bottleneck(self):
+        return max(self.stats(), key=lambda s: s['utilization'])['stage']
+
+    def print_stats(self):
+        print('{:<12}{:>8}{:>8}{:>8}{:>12}{:>12}{:>8}'.format('stage', 'workers', 'items', 'errors', 's/item', 'items/s', 'util'))
+        for s in self.stats():
+            print('{:<12}{:>8}{:>8}{:>8}{:>12.3f}{:>12.3f}{:>8.2f}'.format(s['stage'], s['workers'], s['items'], s['errors'], s['seconds_per_item'], s['items_per_second'], s['utilization']))
+        print('bottleneck: {}'.format(self.bottleneck()))
+
+
+def balance_workers(stats, total_workers):
+    # workers per stage proportional to its measured cost per item, so all stages sustain the same rate
+    costs = {s['stage']: s['seconds_per_item'] for s in stats}
+    total_cost = sum(costs.values())
+    if total_cost == 0:
+        return {k: 1 for k in costs}
+    return {k: max(1, int(round(total_workers * c / total_cost))) for k, c in costs.items()}
@@ -0,0 +1,126 @@
+"""Batch damage prediction with decode, preprocessing, inference, fusion and writing overlapped.
+
+    python predict_batch.py <images_dir> <weights_dir> <out_dir> [decode=2] [preprocess=1] [infer=1] [fuse=2] [write=2] [queue=4] [prefilter=<thr>] [budget=<MB>]
+
+Every *_pre_* image in <images_dir> is paired with its *_post_* image, the full ensemble is run and the
+fused masks are written like the submission: *_localization_*_prediction.png, *_damage_*_prediction.png.
+With prefilter, cls members skip tiles whose change score is below the threshold calibrated by change_filter.py.
+With budget, models are loaded on demand and kept resident up to that many MB (see residency.py).
+"""
+import os
+from os import path, makedirs, listdir
+import sys
+import timeit
+
+import numpy as np
+import cv2
+
+from fusion import fuse_predictions
+from pipeline import Pipeline, Stage
+
+cv2.setNumThreads(0)
+cv2.ocl.setUseOpenCL(False)
+
+default_workers = {'decode': 2, 'preprocess': 1, 'infer': 1, 'fuse': 2, 'write': 2}
+
+
+def build_stages(loaded, out_dir, workers, prefilter=None, residency=None):
+    from ensemble import run_member
+
+    def decode(f):
+        img = cv2.imread(f['pre'], cv2.IMREAD_COLOR)
+        img2 = cv2.imread(f['post'], cv2.IMREAD_COLOR)
+        if img is None or img2 is None:
+            raise ValueError('can not read {}'.format(f['name']))
+        f['img'], f['img2'] = img, img2
+        return f
+
+    def preprocess(f):
+        # RGB like the PIL images the API hands to the models, normalization and TTA happen in the members
+        f['img'] = cv2.cvtColor(f['img'], cv2.COLOR_BGR2RGB)
+        f['img2'] = cv2.cvtColor(f['img2'], cv2.COLOR_BGR2RGB)
+        if f['img'].shape != f['img2'].shape:
+            raise ValueError('pre and post images of {} differ in size'.format(f['name']))
+        return f
+
+    def infer(f):
+        if prefilter is not None:
+            from change_filter import predict_with_prefilter
+            f['msk_loc'], f['msk_dmg'], _ = predict_with_prefilter(loaded, f.pop('img'), f.pop('img2'), prefilter)
+            return f
+        if residency is not None:
+            from residency import run_ensemble
+            f['loc_preds'], f['cls_preds'] = run_ensemble(residency, f['img'], f['img2'])
+            del f['img'], f['img2']
+            return f
+        f['loc_preds'] = [run_member(m, models, f['img'], f['img2']) for m, models in loaded if m.kind == 'loc']
+        f['cls_preds'] = [run_member(m, models, f['img'], f['img2']) for m, models in loaded if m.kind == 'cls']
+        del f['img'], f['img2']
+        return f
+
+    def fuse(f):
+        if 'msk_loc' in f:
+            return f
+        f['msk_loc'], f['msk_dmg'] = fuse_predictions(f.pop('cls_preds'), f.pop('loc_preds'))
+        return f
+
+    def write(f):
+        fn = f['name'].replace(path.splitext(f['name'])[1], '_prediction.png')
+        cv2.imwrite(path.join(out_dir, fn.replace('_pre_', '_localization_')), f['msk_loc'], [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        cv2.imwrite(path.join(out_dir, fn.replace('_pre_', '_damage_')), f['msk_dmg'], [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        return f['name']
+
+    fns = [('decode', decode), ('preprocess', preprocess), ('infer', infer), ('fuse', fuse), ('write', write)]
+    return [Stage(name, fn, workers[name]) for name, fn in fns]
+
+
+def list_pairs(images_dir):
+    res = []
+    for f in sorted(listdir(images_dir)):
+        if '_pre_' in f:
+            res.append({'name': f, 'pre': path.join(images_dir, f), 'post': path.join(images_dir, f.replace('_pre_', '_post_'))})
+    return res
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    images_dir = sys.argv[1]
+    weights_dir = sys.argv[2]
+    out_dir = sys.argv[3]
+    workers = dict(default_workers)
+    queue_size = 4
+    prefilter = None
+    budget = None
+    for arg in sys.argv[4:]:
+        k, v = arg.split('=')
+        if k == 'queue':
+            queue_size = int(v)
+        elif k == 'prefilter':
+            prefilter = float(v)
+        elif k == 'budget':
+            budget = int(v) * 1024 ** 2
+        else:
+            workers[k] = int(v)
+
+    makedirs(out_dir, exist_ok=True)
+
+    residency = None
+    loaded = None
+    if budget is not None:
+        if prefilter is not None:
+            raise ValueError('prefilter needs all members loaded, it can not be combined with budget')
+        from residency import ModelResidency
+        residency = ModelResidency(weights_dir, budget)
+    else:
+        from ensemble import members, load_member
+        loaded = [(m, load_member(m, weights_dir)) for m in members]
+
+    pipe = Pipeline(build_stages(loaded, out_dir, workers, prefilter, residency), queue_size=queue_size)
+    done = pipe.run(list_pairs(images_dir))
+    pipe.print_stats()
+    if residency is not None:
+        print(residency.stats())
+
+    elapsed = timeit.default_timer() - t0
+    print('{} pairs, Time: {:.3f} min'.format(len(done), elapsed / 60))
@@ -0,0 +1,110 @@
+import json
+import base64
+
+import numpy as np
+import cv2
+
+from fusion import fuse_predictions, damage_level
+
+
+def pad32(img):
+    # the UNets downsample 5 times, so their inputs have to be multiples of 32
+    h, w = img.shape[:2]
+    ph = (32 - h % 32) % 32
+    pw = (32 - w % 32) % 32
+    if ph or pw:
+        img = np.pad(img, ((0, ph), (0, pw), (0, 0)), mode='reflect')
+    return img, h, w
+
+
+def run_members(loaded, img, img2):
+    from ensemble import run_member
+
+    img, h, w = pad32(img)
+    img2, _, _ = pad32(img2)
+    loc_preds = [run_member(m, models, img, img2)[:h, :w] for m, models in loaded if m.kind == 'loc']
+    cls_preds = [run_member(m, models, img, img2)[:h, :w] for m, models in loaded if m.kind == 'cls']
+    return loc_preds, cls_preds
+
+
+def preview(loaded, img, img2, scale=0.25):
+    h, w = img.shape[:2]
+    sh = max(32, int(round(h * scale / 32)) * 32)
+    sw = max(32, int(round(w * scale / 32)) * 32)
+    small = cv2.resize(img, (sw, sh), interpolation=cv2.INTER_AREA)
+    small2 = cv2.resize(img2, (sw, sh), interpolation=cv2.INTER_AREA)
+    loc_preds, cls_preds = run_members(loaded, small, small2)
+    loc_preds = [cv2.resize(msk, (w, h), interpolation=cv2.INTER_LINEAR) for msk in loc_preds]
+    cls_preds = [cv2.resize(msk, (w, h), interpolation=cv2.INTER_LINEAR) for msk in cls_preds]
+    return loc_preds, cls_preds
+
+
+def plan_tiles(loc_preds, cls_preds, tile=256, building_thr=0.1, margin_thr=0.2):
+    # tiles with buildings in the preview, most uncertain first; background tiles keep the preview result
+    loc_p = np.asarray(loc_preds).astype('float').mean(axis=0) / 255
+    dmg_p = np.asarray(cls_preds).astype('float').mean(axis=0)[..., 1:] / 255
+    dmg_p.sort(axis=2)
+    dmg_margin = dmg_p[..., -1] - dmg_p[..., -2]
+
+    h, w = loc_p.shape
+    tiles = []
+    for y in range(0, h, tile):
+        for x in range(0, w, tile):
+            bld = loc_p[y:y + tile, x:x + tile] > building_thr
+            if not bld.any():
+                continue
+            uncertain = (dmg_margin[y:y + tile, x:x + tile][bld] < margin_thr).mean()
+            tiles.append((uncertain + bld.mean(), (x, y, min(x + tile, w), min(y + tile, h))))
+    tiles.sort(key=lambda t: -t[0])
+    return [box for _, box in tiles]
+
+
+def progressive_predict(loaded, img, img2, preview_members=None, scale=0.25, tile=256, margin=32, max_tiles=None, building_thr=0.1, margin_thr=0.2):
+    """Coarse-to-fine prediction of one pair, yields an event after the preview and after every refined tile.
+
+    loaded: list of (Member, models) as returned by ensemble.load_member. The preview runs the members named
+    in preview_members (all by default) on the pair downsampled by scale, then tiles with buildings or
+    uncertain damage are re-run at full resolution with all members, with margin pixels of context.
+    """
+    h, w = img.shape[:2]
+    preview_loaded = [(m, models) for m, models in loaded if preview_members is None or m.name in preview_members]
+    loc_preds, cls_preds = preview(preview_loaded, img, img2, scale)
+    msk_loc, msk_dmg = fuse_predictions(cls_preds, loc_preds)
+    tiles = plan_tiles(loc_preds, cls_preds, tile, building_thr, margin_thr)
+    del loc_preds, cls_preds
+    if max_tiles is not None:
+        tiles = tiles[:max_tiles]
+
+    yield {'stage': 'preview' if tiles else 'final', 'box': (0, 0, w, h), 'msk_loc': msk_loc, 'msk_dmg': msk_dmg,
+           'level': damage_level(msk_loc, msk_dmg), 'tiles_done': 0, 'tiles_total': len(tiles)}
+
+    for i, (x0, y0, x1, y1) in enumerate(tiles):
+        cx0, cy0 = max(0, x0 - margin), max(0, y0 - margin)
+        cx1, cy1 = min(w, x1 + margin), min(h, y1 + margin)
+        loc_crop, cls_crop = run_members(loaded, img[cy0:cy1, cx0:cx1], img2[cy0:cy1, cx0:cx1])
+        crop_loc, crop_dmg = fuse_predictions(cls_crop, loc_crop)
+        msk_loc[y0:y1, x0:x1] = crop_loc[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+        msk_dmg[y0:y1, x0:x1] = crop_dmg[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+
+        yield {'stage': 'refine' if i + 1 < len(tiles) else 'final', 'box': (x0, y0, x1, y1),
+               'msk_loc': msk_loc[y0:y1, x0:x1], 'msk_dmg': msk_dmg[y0:y1, x0:x1],
+               'level': damage_level(msk_loc, msk_dmg), 'tiles_done': i + 1, 'tiles_total': len(tiles)}
+
+
+def _png(msk):
+    _, buf = cv2.imencode('.png', msk, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return base64.b64encode(buf.tobytes()).decode('ascii')
+
+
+def encode_events(events):
+    # newline delimited json for a StreamingResponse, masks are base64 pngs of the box they cover
+    for e in events:
+        yield json.dumps({
+            'stage': e['stage'],
+            'box': [int(v) for v in e['box']],
+            'msk_loc': _png(e['msk_loc']),
+            'msk_dmg': _png(e['msk_dmg']),
+            'level': e['level'],
+            'tiles_done': e['tiles_done'],
+            'tiles_total': e['tiles_total'],
+        }) + '\n'
@@ -0,0 +1,198 @@
+"""Keeps ensemble models in memory up to a byte budget, least recently used ones are evicted.
+
+    python residency.py convert <weights_dir>
+
+convert writes every snapshot of the ensemble as a bare state dict to <weights_dir>/fast/, which is
+memory-mapped on load and assigned to a model built on the meta device: no weight initialization, no copy
+of the checkpoint, so an evicted model comes back in a fraction of the time a checkpoint load takes.
+"""
+import os
+from os import path, makedirs
+import sys
+import threading
+import timeit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+
+import torch
+from torch import nn
+
+from ensemble import members, device, load_snapshot, run_member
+
+
+def fast_file(weights_dir, snap):
+    return path.join(weights_dir, 'fast', snap + '.pt')
+
+
+def model_bytes(model):
+    return sum(t.numel() * t.element_size() for t in model.state_dict().values())
+
+
+def convert_snapshots(weights_dir):
+    makedirs(path.join(weights_dir, 'fast'), exist_ok=True)
+    for member in members:
+        for snap in member.snapshots:
+            if not path.exists(path.join(weights_dir, snap)):
+                print('{} not found, skipped'.format(snap))
+                continue
+            model = load_snapshot(member.model_cls, path.join(weights_dir, snap))
+            sd = {k[len('module.'):]: v.cpu() for k, v in model.state_dict().items()}
+            torch.save(sd, fast_file(weights_dir, snap))
+            print('=> wrote {}'.format(fast_file(weights_dir, snap)))
+
+
+def load_fast(model_cls, fn):
+    sd = torch.load(fn, map_location='cpu', mmap=True, weights_only=True)
+    with torch.device('meta'):
+        model = model_cls(pretrained=None)
+    model.load_state_dict(sd, assign=True)
+    model = nn.DataParallel(model).to(device)
+    model.eval()
+    return model
+
+
+class ModelResidency(object):
+    def __init__(self, weights_dir, budget_bytes, prefetch=True):
+        self.weights_dir = weights_dir
+        self.budget_bytes = budget_bytes
+        self.models = OrderedDict()
+        self.sizes = {}
+        self.pinned = {}
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(1) if prefetch else None
+        self.hits = 0
+        self.misses = 0
+        # gets that joined a load already in flight, prefetched or started by another miss
+        self.load_waits = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def _load(self, member, snap):
+        # the in-flight entry is dropped whether the load works or not, a failed load can be retried
+        try:
+            t0 = timeit.default_timer()
+            fn = fast_file(self.weights_dir, snap)
+            model = None
+            if path.exists(fn):
+                try:
+                    model = load_fast(member.model_cls, fn)
+                except Exception as e:
+                    print('fast load of {} failed, using the checkpoint: {}'.format(snap, e))
+            if model is None:
+                model = load_snapshot(member.model_cls, path.join(self.weights_dir, snap))
+            elapsed = timeit.default_timer() - t0
+            size = model_bytes(model)
+            with self.lock:
+                self.loads += 1
+                self.load_seconds += elapsed
+                self._evict(size)
+                self.models[snap] = model
+                self.sizes[snap] = size
+            return model
+        finally:
+            with self.lock:
+                self.loading.pop(snap, None)
+
+    def _evict(self, size):
+        # least recently used first, models in use are never evicted; may end up over budget then
+        used = sum(self.sizes[s] for s in self.models)
+        for snap in list(self.models):
+            if used + size <= self.budget_bytes:
+                break
+            if self.pinned.get(snap, 0) > 0:
+                continue
+            del self.models[snap]
+            used -= self.sizes.pop(snap)
+            self.evictions += 1
+
+    def get(self, member, snap):
+        owner = False
+        with self.lock:
+            model = self.models.get(snap)
+            if model is not None:
+                self.models.move_to_end(snap)
+                self.hits += 1
+                return model
+            future = self.loading.get(snap)
+            if future is not None:
+                self.load_waits += 1
+            else:
+                # registered like a prefetch so concurrent misses wait for this load instead of repeating it
+                self.misses += 1
+                future = self.loading[snap] = Future()
+                owner = True
+        if not owner:
+            return future.result()
+        try:
+            model = self._load(member, snap)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(model)
+        return model
+
+    def prefetch(self, member):
+        if self.executor is None:
+            return
+        with self.lock:
+            for snap in member.snapshots:
+                if snap not in self.models and snap not in self.loading:
+                    self.loading[snap] = self.executor.submit(self._load, member, snap)
+
+    @contextmanager
+    def use(self, member):
+        with self.lock:
+            for snap in member.snapshots:
+                self.pinned[snap] = self.pinned.get(snap, 0) + 1
+        try:
+            yield [self.get(member, snap) for snap in member.snapshots]
+        finally:
+            with self.lock:
+                for snap in member.snapshots:
+                    self.pinned[snap] -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'resident': list(self.models),
+                'resident_bytes': sum(self.sizes.values()),
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'load_waits': self.load_waits,
+                'evictions': self.evictions,
+                'loads': self.loads,
+                'load_seconds': self.load_seconds,
+                'mean_load_seconds': self.load_seconds / max(self.loads, 1),
+            }
+
+
+def run_ensemble(residency, img, img2, ensemble_members=members):
+    # each member's successor is loaded in the background while the member runs
+    loc_preds = []
+    cls_preds = []
+    for i, member in enumerate(ensemble_members):
+        if i + 1 < len(ensemble_members):
+            residency.prefetch(ensemble_members[i + 1])
+        with residency.use(member) as models:
+            msk = run_member(member, models, img, img2)
+        if member.kind == 'loc':
+            loc_preds.append(msk)
+        else:
+            cls_preds.append(msk)
+    return loc_preds, cls_preds
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'convert':
+        convert_snapshots(sys.argv[2])
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
@@ -0,0 +1,226 @@
+"""Ensemble member selection on a labelled validation set.
+
+    python select_ensemble.py cache <val_dir> <weights_dir> <cache_dir>
+    python select_ensemble.py select <val_dir> <cache_dir> <out_dir>
+
+<val_dir> uses the xView2 layout: images/<name>_pre_disaster.png, images/<name>_post_disaster.png
+and the rasterized targets masks/<name>_pre_disaster.png (buildings), masks/<name>_post_disaster.png (damage 1..4).
+
+`cache` runs every member once and stores its outputs like the prediction folders read by
+create_submission, together with the CPU seconds per pair. `select` only reads the cache: it runs greedy
+forward and backward selection with the create_submission fusion rules, reports the marginal contribution
+of every member and writes the Pareto-optimal configurations (score vs CPU seconds).
+"""
+import os
+from os import path, makedirs, listdir
+import sys
+import json
+import time
+import timeit
+
+import numpy as np
+import cv2
+
+from fusion import fuse_predictions, score_counts, xview2_score
+from utils import load_image
+
+cv2.setNumThreads(0)
+cv2.ocl.setUseOpenCL(False)
+
+
+def list_pairs(val_dir):
+    return [f.replace('_pre_disaster.png', '') for f in sorted(listdir(path.join(val_dir, 'images'))) if f.endswith('_pre_disaster.png')]
+
+
+def cache_members(val_dir, weights_dir, cache_dir):
+    from ensemble import members, load_member, run_member, split_parts
+
+    names = list_pairs(val_dir)
+    timings_file = path.join(cache_dir, 'timings.json')
+    timings = {}
+    if path.exists(timings_file):
+        with open(timings_file) as f:
+            timings = json.load(f)
+
+    for member in members:
+        if member.name in timings:
+            print('{} already cached'.format(member.name))
+            continue
+        makedirs(path.join(cache_dir, member.name), exist_ok=True)
+        models = load_member(member, weights_dir)
+        cpu = 0
+        wall = 0
+        for f in names:
+            img = load_image(path.join(val_dir, 'images', f + '_pre_disaster.png'))
+            img2 = load_image(path.join(val_dir, 'images', f + '_post_disaster.png'))
+
+            t0 = time.process_time()
+            t1 = timeit.default_timer()
+            msk = run_member(member, models, img, img2)
+            cpu += time.process_time() - t0
+            wall += timeit.default_timer() - t1
+
+            if member.kind == 'loc':
+                cv2.imwrite(path.join(cache_dir, member.name, f + '_part1.png'), msk, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+            else:
+                msk1, msk2 = split_parts(msk)
+                cv2.imwrite(path.join(cache_dir, member.name, f + '_part1.png'), msk1, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+                cv2.imwrite(path.join(cache_dir, member.name, f + '_part2.png'), msk2, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        del models
+
+        timings[member.name] = {'kind': member.kind, 'cpu_seconds': cpu / len(names), 'wall_seconds': wall / len(names)}
+        print('{}: {:.2f} cpu s / pair, {:.2f} s / pair'.format(member.name, timings[member.name]['cpu_seconds'], timings[member.name]['wall_seconds']))
+        # written after every member so an interrupted run can be resumed
+        with open(timings_file, 'w') as f:
+            json.dump(timings, f, indent=2)
+
+
+def load_cached(cache_dir, name, kind, f):
+    msk1 = cv2.imread(path.join(cache_dir, name, f + '_part1.png'), cv2.IMREAD_UNCHANGED)
+    if kind == 'loc':
+        return msk1
+    msk2 = cv2.imread(path.join(cache_dir, name, f + '_part2.png'), cv2.IMREAD_UNCHANGED)
+    return np.concatenate([msk1, msk2[..., 1:]], axis=2)
+
+
+class Selector(object):
+    def __init__(self, val_dir, cache_dir):
+        self.val_dir = val_dir
+        self.cache_dir = cache_dir
+        with open(path.join(cache_dir, 'timings.json')) as f:
+            self.timings = json.load(f)
+        self.names = list_pairs(val_dir)
+        self.loc_names = [m for m in self.timings if self.timings[m]['kind'] == 'loc']
+        self.cls_names = [m for m in self.timings if self.timings[m]['kind'] == 'cls']
+        self.scores = {}
+
+    def cost(self, config):
+        return sum(self.timings[m]['cpu_seconds'] for m in config)
+
+    def valid(self, config):
+        return any(m in self.loc_names for m in config) and any(m in self.cls_names for m in config)
+
+    def evaluate(self, configs):
+        # all configs of one greedy step are scored in a single pass over the images
+        todo = [c for c in set(configs) if c not in self.scores]
+        if todo:
+            counts = [np.zeros((5, 3), dtype='int64') for _ in todo]
+            needed = set(m for c in todo for m in c)
+            for f in self.names:
+                outs = {m: load_cached(self.cache_dir, m, self.timings[m]['kind'], f) for m in needed}
+                lbl_loc = cv2.imread(path.join(self.val_dir, 'masks', f + '_pre_disaster.png'), cv2.IMREAD_UNCHANGED)
+                lbl_dmg = cv2.imread(path.join(self.val_dir, 'masks', f + '_post_disaster.png'), cv2.IMREAD_UNCHANGED)
+                for i, c in enumerate(todo):
+                    msk_loc, msk_dmg = fuse_predictions([outs[m] for m in self.cls_names if m in c], [outs[m] for m in self.loc_names if m in c])
+                    counts[i] += score_counts(msk_loc, msk_dmg, lbl_loc, lbl_dmg)
+            for c, cnt in zip(todo, counts):
+                self.scores[c] = xview2_score(cnt)[0]
+        return [self.scores[c] for c in configs]
+
+    def best(self, configs):
+        scores = self.evaluate(configs)
+        i = int(np.argmax(scores))
+        return configs[i], scores[i]
+
+    def forward(self):
+        # start from the best loc/cls pair and keep adding the member with the highest fused score
+        current, score = self.best([frozenset([l, c]) for l in self.loc_names for c in self.cls_names])
+        trajectory = [(current, score)]
+        while len(current) < len(self.timings):
+            current, score = self.best([current | {m} for m in self.timings if m not in current])
+            trajectory.append((current, score))
+        return trajectory
+
+    def backward(self):
+        # start from the full ensemble and keep dropping the member whose removal hurts least
+        current = frozenset(self.timings)
+        trajectory = [(current, self.evaluate([current])[0])]
+        while True:
+            candidates = [current - {m} for m in current if self.valid(current - {m})]
+            if not candidates:
+                break
+            current, score = self.best(candidates)
+            trajectory.append((current, score))
+        return trajectory
+
+    def marginal_contributions(self):
+        full = frozenset(self.timings)
+        full_score = self.evaluate([full])[0]
+        res = {}
+        for m in self.timings:
+            if self.valid(full - {m}):
+                res[m] = full_score - self.evaluate([full - {m}])[0]
+        return res
+
+    def pareto(self):
+        # configurations no other evaluated configuration beats on both score and cost
+        configs = sorted(self.scores, key=lambda c: (self.cost(c), -self.scores[c]))
+        front = []
+        for c in configs:
+            if not front or self.scores[c] > self.scores[front[-1]]:
+                front.append(c)
+        return front
+
+    def describe(self, config):
+        return {
+            'loc_folders': [m for m in self.loc_names if m in config],
+            'pred_folders': [m for m in self.cls_names if m in config],
+            'score': self.scores[config],
+            'cpu_seconds': self.cost(config),
+        }
+
+
+def plot(selector, front, out_file):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    configs = list(selector.scores)
+    plt.figure(figsize=(10, 6))
+    plt.scatter([selector.cost(c) for c in configs], [selector.scores[c] for c in configs], s=10, c='gray', label='evaluated')
+    plt.plot([selector.cost(c) for c in front], [selector.scores[c] for c in front], 'o-', c='red', label='pareto')
+    plt.xlabel('CPU seconds / pair')
+    plt.ylabel('fused score')
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(out_file, dpi=100)
+    plt.close()
+
+
+def select(val_dir, cache_dir, out_dir):
+    makedirs(out_dir, exist_ok=True)
+    selector = Selector(val_dir, cache_dir)
+
+    contributions = selector.marginal_contributions()
+    for m in sorted(contributions, key=contributions.get):
+        print('{}: {:+.5f} score, {:.2f} cpu s'.format(m, contributions[m], selector.timings[m]['cpu_seconds']))
+
+    fwd = selector.forward()
+    bwd = selector.backward()
+    front = selector.pareto()
+    for c in front:
+        print('{:.5f} @ {:.2f} cpu s: {}'.format(selector.scores[c], selector.cost(c), sorted(c)))
+
+    res = {
+        'marginal_contributions': contributions,
+        'forward': [selector.describe(c) for c, _ in fwd],
+        'backward': [selector.describe(c) for c, _ in bwd],
+        'pareto': [selector.describe(c) for c in front],
+    }
+    with open(path.join(out_dir, 'selection.json'), 'w') as f:
+        json.dump(res, f, indent=2)
+    plot(selector, front, path.join(out_dir, 'pareto.png'))
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if sys.argv[1] == 'cache':
+        cache_members(sys.argv[2], sys.argv[3], sys.argv[4])
+    elif sys.argv[1] == 'select':
+        select(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
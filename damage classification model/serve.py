@@ -0,0 +1,52 @@
+"""Damage assessment API that can run with several worker processes sharing one copy of the weights.
+
+    WEIGHTS_DIR=weights gunicorn -c gunicorn.conf.py serve:app
+
+The weights are loaded when the module is imported, gunicorn.conf.py sets preload_app so that happens once
+in the master before the workers fork (see shared_weights.py). Plain `uvicorn serve:app --workers N` works
+too when the weights are packed, every worker then maps the same file.
+"""
+import os
+
+import cv2
+from fastapi import FastAPI, File, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from ensemble import run_member
+from fusion import fuse_predictions, damage_level, damage_level_name
+from ingest import read_upload
+from shared_weights import load_shared_members
+
+cv2.setNumThreads(0)
+cv2.ocl.setUseOpenCL(False)
+
+weights_dir = os.environ.get('WEIGHTS_DIR', 'weights')
+loaded = load_shared_members(weights_dir)
+
+app = FastAPI()
+
+
+@app.get("/")
+def health_check():
+    return {"status": "Running", "pid": os.getpid()}
+
+
+def assess(img, img2):
+    loc_preds = [run_member(m, models, img, img2) for m, models in loaded if m.kind == 'loc']
+    cls_preds = [run_member(m, models, img, img2) for m, models in loaded if m.kind == 'cls']
+    msk_loc, msk_dmg = fuse_predictions(cls_preds, loc_preds)
+    return damage_level(msk_loc, msk_dmg)
+
+
+@app.post("/upload-image/")
+async def upload_image(file1: UploadFile = File(...), file2: UploadFile = File(...)):
+    try:
+        image_pre, _ = await read_upload(file1)
+        image_post, _ = await read_upload(file2)
+    except ValueError as e:
+        return {"error": str(e)}
+    if image_post.shape != image_pre.shape:
+        return {"error": "Pre and post images must have the same size."}
+    # the ensemble runs in the threadpool, the event loop keeps serving health checks and other uploads
+    level = await run_in_threadpool(assess, image_pre, image_post)
+    return {"level": damage_level_name(level)}
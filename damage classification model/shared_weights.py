@@ -0,0 +1,121 @@
+"""One read-only copy of the ensemble weights for all serving processes.
+
+    python shared_weights.py pack <weights_dir> [out_file]
+
+pack writes the weights of every snapshot into a single flat file (<weights_dir>/ensemble.weights by default)
+plus a json index of tensor offsets. attach_members maps that file read-only and builds the models on top of
+it, so every process that attaches - gunicorn workers, uvicorn workers, a notebook - shares the same page
+cache pages instead of holding its own copy. Without a packed file, load_shared_members loads the
+checkpoints and moves them into shared memory, which is shared with the workers forked afterwards.
+"""
+import os
+from os import path
+import sys
+import json
+import mmap
+import timeit
+import warnings
+
+import numpy as np
+import torch
+from torch import nn
+
+from ensemble import members, device, load_member
+
+_align = 64
+
+
+def packed_file(weights_dir):
+    return path.join(weights_dir, 'ensemble.weights')
+
+
+def pack_weights(weights_dir, out_file=None):
+    if out_file is None:
+        out_file = packed_file(weights_dir)
+    index = {}
+    offset = 0
+    with open(out_file, 'wb') as f:
+        for member in members:
+            for snap, model in zip(member.snapshots, load_member(member, weights_dir)):
+                tensors = {}
+                for k, v in model.state_dict().items():
+                    a = np.ascontiguousarray(v.cpu().numpy())
+                    pad = -offset % _align
+                    f.write(b'\0' * pad)
+                    offset += pad
+                    tensors[k[len('module.'):]] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset}
+                    f.write(a.tobytes())
+                    offset += a.nbytes
+                index[snap] = tensors
+                print('=> packed {}'.format(snap))
+    with open(out_file + '.json', 'w') as f:
+        json.dump(index, f)
+    print('{} MB written to {}'.format(offset // 1024 ** 2, out_file))
+    return out_file
+
+
+def _build(model_cls, sd):
+    with torch.device('meta'):
+        model = model_cls(pretrained=None)
+    model.load_state_dict(sd, assign=True)
+    model = nn.DataParallel(model).to(device)
+    model.eval()
+    return model
+
+
+def attach_members(weights_file):
+    with open(weights_file + '.json') as f:
+        index = json.load(f)
+    with open(weights_file, 'rb') as f:
+        # the mapping stays alive through the arrays viewing it
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    loaded = []
+    with warnings.catch_warnings():
+        # tensors over a read-only mapping, which is the point: inference never writes the weights
+        warnings.simplefilter('ignore', UserWarning)
+        for member in members:
+            models = []
+            for snap in member.snapshots:
+                sd = {}
+                for k, t in index[snap].items():
+                    dtype = np.dtype(t['dtype'])
+                    count = int(np.prod(t['shape']))
+                    a = np.frombuffer(buf, dtype=dtype, count=count, offset=t['offset']).reshape(t['shape'])
+                    sd[k] = torch.from_numpy(a)
+                models.append(_build(member.model_cls, sd))
+            loaded.append((member, models))
+    return loaded
+
+
+def share_models(models):
+    for model in models:
+        for t in model.state_dict().values():
+            t.share_memory_()
+    return models
+
+
+def load_shared_members(weights_dir):
+    """(member, models) for the whole ensemble, with the weights held once for all processes.
+
+    Call it before the workers fork (gunicorn preload_app) when the weights are not packed.
+    """
+    t0 = timeit.default_timer()
+    fn = packed_file(weights_dir)
+    if path.exists(fn) and path.exists(fn + '.json'):
+        loaded = attach_members(fn)
+    else:
+        loaded = [(m, share_models(load_member(m, weights_dir))) for m in members]
+    print('ensemble weights ready in {:.1f} s'.format(timeit.default_timer() - t0))
+    return loaded
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'pack':
+        pack_weights(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
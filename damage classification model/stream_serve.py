@@ -0,0 +1,222 @@
+"""Continuous damage assessment of a stream of pairs with localization, classification and fusion overlapped.
+
+    python stream_serve.py calibrate <images_dir> <weights_dir> <plan_file> [pairs=4] [workers=<cores>]
+    python stream_serve.py watch <images_dir> <weights_dir> <out_dir> [plan=<plan_file>] [queue=4] [shard=0/1] [poll=2]
+
+Each pair goes decode -> loc members -> cls members -> fuse, every stage has its own worker pool, so while
+one pair is in the cls members the next one is already in the loc members. calibrate measures the cost
+of every stage on a few pairs with one worker each and writes pool sizes proportional to them.
+watch keeps picking up new *_pre_* / *_post_* pairs in <images_dir> and writes the fused masks and a
+json with per-building damage. With shard=i/n every node only takes the pairs whose name hashes to i,
+so several nodes can share one folder.
+"""
+import os
+from os import path, makedirs, listdir
+import sys
+import json
+import time
+import timeit
+import zlib
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+import cv2
+import torch
+
+from fusion import fuse_predictions, damage_level, damage_level_name, building_damage
+from pipeline import Pipeline, Stage, balance_workers
+
+cv2.setNumThreads(0)
+cv2.ocl.setUseOpenCL(False)
+
+default_workers = {'decode': 1, 'loc': 1, 'cls': 1, 'fuse': 1}
+# scans a pair that fails to decode is retried for by watch, it may still be being written
+max_decode_attempts = 5
+
+
+class DecodeError(ValueError):
+    pass
+
+
+class EnsembleStream(object):
+    """Long running stage pipeline, submit() returns a Future resolved with the assessment of the pair.
+
+    loaded: list of (Member, models). Items are dicts with 'img' / 'img2' arrays (RGB) or 'pre' / 'post'
+    file names to decode. torch threads are split between the loc and cls workers.
+    """
+    def __init__(self, loaded, workers=None, queue_size=4):
+        self.loaded = loaded
+        self.workers = dict(default_workers)
+        self.workers.update(workers or {})
+        torch.set_num_threads(max(1, multiprocessing.cpu_count() // (self.workers['loc'] + self.workers['cls'])))
+        self.pipe = Pipeline(self._stages(), queue_size=queue_size)
+
+    def _stages(self):
+        from ensemble import run_member
+
+        def decode(f):
+            if 'img' not in f:
+                img = cv2.imread(f['pre'], cv2.IMREAD_COLOR)
+                img2 = cv2.imread(f['post'], cv2.IMREAD_COLOR)
+                if img is None or img2 is None:
+                    raise DecodeError('can not read {}'.format(f['name']))
+                f['img'] = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                f['img2'] = cv2.cvtColor(img2, cv2.COLOR_BGR2RGB)
+            if f['img'].shape != f['img2'].shape:
+                raise ValueError('pre and post images of {} differ in size'.format(f['name']))
+            return f
+
+        def loc(f):
+            f['loc_preds'] = [run_member(m, models, f['img'], f['img2']) for m, models in self.loaded if m.kind == 'loc']
+            return f
+
+        def cls(f):
+            f['cls_preds'] = [run_member(m, models, f['img'], f['img2']) for m, models in self.loaded if m.kind == 'cls']
+            del f['img'], f['img2']
+            return f
+
+        def fuse(f):
+            f['msk_loc'], f['msk_dmg'] = fuse_predictions(f.pop('cls_preds'), f.pop('loc_preds'))
+            f['level'] = damage_level_name(damage_level(f['msk_loc'], f['msk_dmg']))
+            f['buildings'] = building_damage(f['msk_loc'], f['msk_dmg'])
+            return f
+
+        fns = [('decode', decode), ('loc', loc), ('cls', cls), ('fuse', fuse)]
+        return [Stage(name, self._guard(fn), self.workers[name]) for name, fn in fns]
+
+    def _guard(self, fn):
+        # a failing pair resolves its future with the error instead of vanishing in the pipeline
+        def run(f):
+            try:
+                return fn(f)
+            except Exception as e:
+                f['future'].set_exception(e)
+                raise
+        return run
+
+    def start(self):
+        self.pipe.start()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+        return self
+
+    def _collect(self):
+        for f in self.pipe.results():
+            f.pop('future').set_result(f)
+
+    def submit(self, item):
+        item['future'] = Future()
+        self.pipe.put(item)
+        return item['future']
+
+    def close(self):
+        self.pipe.close()
+        self.collector.join()
+        self.pipe.join()
+
+    def stats(self):
+        return self.pipe.stats()
+
+
+def list_pairs(images_dir, shard=(0, 1)):
+    res = []
+    for f in sorted(listdir(images_dir)):
+        if '_pre_' in f and zlib.crc32(f.encode()) % shard[1] == shard[0]:
+            post = path.join(images_dir, f.replace('_pre_', '_post_'))
+            if path.exists(post):
+                res.append({'name': f, 'pre': path.join(images_dir, f), 'post': post})
+    return res
+
+
+def calibrate(images_dir, loaded, plan_file, pairs=4, total_workers=None):
+    stream = EnsembleStream(loaded).start()
+    futures = [stream.submit(f) for f in list_pairs(images_dir)[:pairs]]
+    for fut in futures:
+        fut.exception()
+    stream.close()
+    stream.pipe.print_stats()
+    if total_workers is None:
+        total_workers = multiprocessing.cpu_count()
+    plan = balance_workers(stream.stats(), total_workers)
+    with open(plan_file, 'w') as f:
+        json.dump(plan, f, indent=2)
+    print('workers: {}'.format(plan))
+    return plan
+
+
+def write_result(out_dir, f):
+    fn = f['name'].replace(path.splitext(f['name'])[1], '_prediction.png')
+    cv2.imwrite(path.join(out_dir, fn.replace('_pre_', '_localization_')), f['msk_loc'], [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    cv2.imwrite(path.join(out_dir, fn.replace('_pre_', '_damage_')), f['msk_dmg'], [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    with open(path.join(out_dir, fn.replace('_pre_', '_buildings_').replace('.png', '.json')), 'w') as out:
+        json.dump({'level': f['level'], 'buildings': f['buildings']}, out)
+
+
+def watch(images_dir, loaded, out_dir, workers=None, queue_size=4, shard=(0, 1), poll=2.0):
+    makedirs(out_dir, exist_ok=True)
+    stream = EnsembleStream(loaded, workers, queue_size).start()
+    seen = set()
+    attempts = {}
+    seen_lock = threading.Lock()
+    done = [0]
+    t0 = timeit.default_timer()
+
+    def on_done(fut, name):
+        e = fut.exception()
+        if e is not None:
+            if isinstance(e, DecodeError):
+                with seen_lock:
+                    attempts[name] = attempts.get(name, 0) + 1
+                    if attempts[name] < max_decode_attempts:
+                        # picked up again on the next scan
+                        seen.discard(name)
+                        return
+            print('Error: {}'.format(e))
+            return
+        write_result(out_dir, fut.result())
+        done[0] += 1
+        print('{} done, {:.1f} pairs/min'.format(fut.result()['name'], done[0] * 60 / (timeit.default_timer() - t0)))
+
+    try:
+        while True:
+            now = time.time()
+            for f in list_pairs(images_dir, shard):
+                # files modified during the last poll interval may still be being copied in
+                try:
+                    if now - max(path.getmtime(f['pre']), path.getmtime(f['post'])) < poll:
+                        continue
+                except OSError:
+                    continue
+                with seen_lock:
+                    if f['name'] in seen:
+                        continue
+                    seen.add(f['name'])
+                stream.submit(f).add_done_callback(lambda fut, name=f['name']: on_done(fut, name))
+            time.sleep(poll)
+    except KeyboardInterrupt:
+        stream.close()
+        stream.pipe.print_stats()
+
+
+if __name__ == '__main__':
+    t0 = timeit.default_timer()
+
+    if len(sys.argv) > 4 and sys.argv[1] in ('calibrate', 'watch'):
+        opts = dict(arg.split('=') for arg in sys.argv[5:])
+        from ensemble import members, load_member
+        loaded = [(m, load_member(m, sys.argv[3])) for m in members]
+        if sys.argv[1] == 'calibrate':
+            calibrate(sys.argv[2], loaded, sys.argv[4], int(opts.get('pairs', 4)), int(opts['workers']) if 'workers' in opts else None)
+        else:
+            workers = None
+            if 'plan' in opts:
+                with open(opts['plan']) as f:
+                    workers = json.load(f)
+            shard = tuple(int(v) for v in opts.get('shard', '0/1').split('/'))
+            watch(sys.argv[2], loaded, sys.argv[4], workers, int(opts.get('queue', 4)), shard, float(opts.get('poll', 2)))
+    else:
+        print(__doc__)
+
+    elapsed = timeit.default_timer() - t0
+    print('Time: {:.3f} min'.format(elapsed / 60))
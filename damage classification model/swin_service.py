@@ -0,0 +1,139 @@
+import threading
+import queue
+import timeit
+from concurrent.futures import Future
+
+import numpy as np
+import cv2
+import torch
+import torch.nn as nn
+from torchvision.models import swin_t
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+input_size = 224
+_mean = np.array([0.485, 0.456, 0.406], dtype='float32') * 255
+_std = np.array([0.229, 0.224, 0.225], dtype='float32') * 255
+
+
+def create_model(num_classes=6):
+    # the checkpoint holds every weight, so the ImageNet ones are not fetched
+    model = swin_t(weights=None)
+    num_features = model.head.in_features
+    model.head = nn.Sequential(
+        nn.LayerNorm(num_features),
+        nn.Linear(num_features, 512),
+        nn.GELU(),
+        nn.Dropout(0.1),
+        nn.Linear(512, num_classes)
+    )
+    return model
+
+
+def load_classifier(checkpoint_path):
+    checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    classes = checkpoint['classes']
+    model = create_model(num_classes=len(classes))
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model = model.to(device)
+    model.eval()
+    return model, classes
+
+
+def preprocess_batch(imgs):
+    # HxWx3 uint8 RGB images of any size -> normalized Nx3x224x224 float32, resized straight into one buffer.
+    # cv2 resizing does not reproduce the torchvision (PIL) Resize the classifier was trained with bit for
+    # bit, so probabilities can differ slightly from the original transform pipeline.
+    batch = np.empty((len(imgs), input_size, input_size, 3), dtype='uint8')
+    for i, img in enumerate(imgs):
+        interpolation = cv2.INTER_AREA if min(img.shape[:2]) > input_size else cv2.INTER_LINEAR
+        cv2.resize(img, (input_size, input_size), dst=batch[i], interpolation=interpolation)
+    x = torch.from_numpy(batch).to(device).permute(0, 3, 1, 2).float()
+    x -= torch.from_numpy(_mean).to(device).view(1, 3, 1, 1)
+    x /= torch.from_numpy(_std).to(device).view(1, 3, 1, 1)
+    return x.contiguous()
+
+
+def check_input(img, topk):
+    if not isinstance(topk, int) or topk < 1:
+        raise ValueError('topk must be a positive integer, got {!r}'.format(topk))
+    if not isinstance(img, np.ndarray) or img.dtype != np.uint8 or img.ndim != 3 or img.shape[2] != 3 or min(img.shape[:2]) < 1:
+        raise ValueError('expected an HxWx3 uint8 image, got {}'.format(
+            '{} {}'.format(img.dtype, img.shape) if isinstance(img, np.ndarray) else type(img).__name__))
+
+
+class SwinService(object):
+    """Disaster type classifier that batches concurrent requests.
+
+    classify() queues one image and returns a Future; a background thread runs everything queued within
+    max_wait seconds, up to max_batch images, as one forward pass. classify_many() batches a known list
+    directly. Results are the topk classes (the service default unless given per call) with their
+    probabilities, most likely first.
+    """
+    def __init__(self, model, classes, max_batch=32, max_wait=0.01, topk=3):
+        self.model = model
+        self.classes = classes
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.topk = topk
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.images = 0
+        self.busy = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _forward(self, imgs, topk):
+        t0 = timeit.default_timer()
+        with torch.inference_mode():
+            probs = torch.softmax(self.model(preprocess_batch(imgs)), dim=1)
+            p, idx = probs.topk(min(topk, len(self.classes)), dim=1)
+        p, idx = p.cpu().numpy(), idx.cpu().numpy()
+        self.batches += 1
+        self.images += len(imgs)
+        self.busy += timeit.default_timer() - t0
+        return [[{'class': self.classes[j], 'probability': float(q)} for q, j in zip(p[i], idx[i])] for i in range(len(imgs))]
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = timeit.default_timer() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - timeit.default_timer()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                res = self._forward([img for img, _, _ in batch], max(topk for _, topk, _ in batch))
+                for (_, topk, fut), r in zip(batch, res):
+                    fut.set_result(r[:topk])
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+
+    def classify(self, img, topk=None):
+        # checked here, a bad request only fails its own Future instead of every request batched with it
+        fut = Future()
+        topk = self.topk if topk is None else topk
+        try:
+            check_input(img, topk)
+        except ValueError as e:
+            fut.set_exception(e)
+            return fut
+        self.requests.put((img, topk, fut))
+        return fut
+
+    def classify_many(self, imgs, topk=None):
+        topk = self.topk if topk is None else topk
+        for img in imgs:
+            check_input(img, topk)
+        res = []
+        for i in range(0, len(imgs), self.max_batch):
+            res.extend(self._forward(imgs[i:i + self.max_batch], topk))
+        return res
+
+    def stats(self):
+        return {'batches': self.batches, 'images': self.images, 'mean_batch': self.images / max(self.batches, 1), 'busy_seconds': self.busy}
@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+nn = torch.nn
+
+from zoo.dpn import DualPathBlock, DualPathStage
+
+
+def _randomize_bn(module):
+    # non-trivial running statistics, otherwise eval-mode batch norm is almost the identity
+    for m in module.modules():
+        if isinstance(m, nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 1.5)
+            m.weight.data.uniform_(0.5, 1.5)
+            m.bias.data.uniform_(-0.5, 0.5)
+
+
+def _stage(first_type, b, pool):
+    in_chs, r, bw, inc, groups = 32, 16, 32, 8, 4
+    blocks = [DualPathBlock(in_chs, r, r, bw, inc, groups, first_type, b)]
+    chs = bw + 3 * inc
+    for _ in range(3):
+        blocks.append(DualPathBlock(chs, r, r, bw, inc, groups, 'normal', b))
+        chs += inc
+    modules = ([nn.MaxPool2d(kernel_size=3, stride=2, padding=1)] if pool else []) + blocks
+    stage = DualPathStage(*modules)
+    _randomize_bn(stage)
+    return stage.eval()
+
+
+@pytest.mark.parametrize("first_type", ['proj', 'down'])
+@pytest.mark.parametrize("b", [False, True])
+@pytest.mark.parametrize("pool", [False, True])
+def test_buffer_path_matches_stacked_blocks(first_type, b, pool):
+    torch.manual_seed(0)
+    stage = _stage(first_type, b, pool)
+    x = torch.randn(2, 32, 24, 20)
+    with torch.no_grad():
+        # the original forward: nn.Sequential over the blocks, concatenated like the decoder does
+        expected = torch.cat(nn.Sequential.forward(stage, x.clone()), dim=1)
+        got = stage(x.clone())
+    assert got.shape == expected.shape
+    assert torch.allclose(got, expected, atol=1e-5, rtol=1e-4)
+
+
+def test_grad_enabled_uses_original_path():
+    torch.manual_seed(0)
+    stage = _stage('proj', False, False)
+    out = stage(torch.randn(1, 32, 8, 8))
+    assert isinstance(out, tuple)
@@ -0,0 +1,36 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from fusion import damage_level, damage_level_name, damage_levels, building_damage, no_buildings
+
+
+def _pair(cls):
+    # one 20x20 building of damage class cls on an empty 64x64 tile
+    msk_loc = np.zeros((64, 64), dtype='uint8')
+    msk_dmg = np.zeros((64, 64), dtype='uint8')
+    msk_loc[10:30, 10:30] = 1
+    msk_dmg[10:30, 10:30] = cls
+    return msk_loc, msk_dmg
+
+
+def test_level_names_are_one_based():
+    assert damage_level_name(0) == no_buildings
+    assert [damage_level_name(level) for level in range(1, 5)] == damage_levels
+
+
+@pytest.mark.parametrize("cls", [1, 2, 3, 4])
+def test_summary_level_agrees_with_buildings(cls):
+    msk_loc, msk_dmg = _pair(cls)
+    level = damage_level(msk_loc, msk_dmg)
+    assert level == cls
+    buildings = building_damage(msk_loc, msk_dmg)
+    assert len(buildings) == 1
+    assert buildings[0]['damage_name'] == damage_level_name(level) == damage_levels[cls - 1]
+
+
+def test_nothing_localized():
+    msk = np.zeros((64, 64), dtype='uint8')
+    assert damage_level_name(damage_level(msk, msk)) == no_buildings
+    assert building_damage(msk, msk) == []
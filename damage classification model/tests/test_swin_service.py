@@ -0,0 +1,26 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+from swin_service import SwinService
+
+
+class _Model(torch.nn.Module):
+    # stands in for the classifier: fixed logits whatever the image
+    def forward(self, x):
+        return torch.arange(4, dtype=torch.float32).repeat(x.shape[0], 1)
+
+
+def test_bad_request_does_not_fail_its_batch():
+    service = SwinService(_Model(), ['a', 'b', 'c', 'd'], max_wait=0.2)
+    good = service.classify(np.zeros((32, 48, 3), dtype='uint8'), 2)
+    gray = service.classify(np.zeros((32, 48), dtype='uint8'))
+    floats = service.classify(np.zeros((32, 48, 3), dtype='float32'))
+    zero_topk = service.classify(np.zeros((32, 48, 3), dtype='uint8'), 0)
+    assert [p['class'] for p in good.result(timeout=10)] == ['d', 'c']
+    for fut in (gray, floats, zero_topk):
+        with pytest.raises(ValueError):
+            fut.result(timeout=10)
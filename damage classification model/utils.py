@@ -1,7 +1,13 @@
 import numpy as np
+import cv2
         
 def preprocess_inputs(x):
     x = np.asarray(x, dtype='float32')
     x /= 127
     x -= 1
-    return x
\ No newline at end of file
+    return x
+
+def load_image(fn):
+    # RGB like the PIL images the API hands to the models
+    img = cv2.imread(fn, cv2.IMREAD_COLOR)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
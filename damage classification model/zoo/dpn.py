@@ -293,6 +293,12 @@ class DualPathBlock(nn.Module):
         else:
             x_s1 = x[0]
             x_s2 = x[1]
+        out1, out2 = self.branch(x_in)
+        resid = x_s1 + out1
+        dense = torch.cat([x_s2, out2], dim=1)
+        return resid, dense
+
+    def branch(self, x_in):
         x_in = self.c1x1_a(x_in)
         x_in = self.c3x3_b(x_in)
         if self.b:
@@ -303,9 +309,54 @@ class DualPathBlock(nn.Module):
             x_in = self.c1x1_c(x_in)
             out1 = x_in[:, :self.num_1x1_c, :, :]
             out2 = x_in[:, self.num_1x1_c:, :, :]
-        resid = x_s1 + out1
-        dense = torch.cat([x_s2, out2], dim=1)
-        return resid, dense
+        return out1, out2
+
+    def forward_buffer(self, buf, c):
+        # Inference-only variant of forward for 'normal' blocks: buf[:, :c] already holds [resid, dense],
+        # the residual is updated in place and the dense increment is written to buf[:, c:c + inc].
+        out1, out2 = self.branch(buf[:, :c])
+        buf[:, :self.num_1x1_c].add_(out1)
+        buf[:, c:c + self.inc] = out2
+        return c + self.inc
+
+
+class DualPathStage(nn.Sequential):
+    """nn.Sequential of DualPathBlocks (optionally preceded by plain modules such as a max pool).
+
+    In training it behaves exactly like nn.Sequential. Under torch.no_grad() in eval mode the dense path
+    of the whole stage lives in one preallocated buffer: every block writes its increment into a slice
+    instead of re-concatenating the ever-growing dense tensor, and the [resid, dense] concatenation
+    consumers ask for is the buffer itself. Setting DualPathStage.use_buffer = False forces the plain
+    nn.Sequential path everywhere (parity.py does so for its reference).
+    """
+    use_buffer = True
+
+    def forward(self, x):
+        if self.training or torch.is_grad_enabled() or not self.use_buffer:
+            return super(DualPathStage, self).forward(x)
+
+        modules = list(self)
+        i = 0
+        while i < len(modules) and not isinstance(modules[i], DualPathBlock):
+            x = modules[i](x)
+            i += 1
+        blocks = modules[i:]
+        if not blocks or not all(isinstance(b, DualPathBlock) and not b.has_proj for b in blocks[1:]):
+            for m in blocks:
+                x = m(x)
+            return x
+
+        resid, dense = blocks[0](x)
+        n, _, h, w = resid.shape
+        c_resid = resid.size(1)
+        c = c_resid + dense.size(1)
+        buf = resid.new_empty((n, c + sum(b.inc for b in blocks[1:]), h, w))
+        buf[:, :c_resid] = resid
+        buf[:, c_resid:c] = dense
+        del resid, dense
+        for b in blocks[1:]:
+            c = b.forward_buffer(buf, c)
+        return buf
 
 
 class DPN(nn.Module):
@@ -6,7 +6,7 @@ import torch.nn.functional as F
 import torchvision.models
 
 from .senet import se_resnext50_32x4d, senet154
-from .dpn import dpn92
+from .dpn import dpn92, DualPathStage
 
 
 class ConvReluBN(nn.Module):
@@ -264,13 +264,13 @@ class Dpn92_Unet_Loc(nn.Module):
                 encoder.blocks['conv1_1'].bn,  # bn
                 encoder.blocks['conv1_1'].act,  # relu
             )
-        self.conv2 = nn.Sequential(
+        self.conv2 = DualPathStage(
                 encoder.blocks['conv1_1'].pool,  # maxpool
                 *[b for k, b in encoder.blocks.items() if k.startswith('conv2_')]
             )
-        self.conv3 = nn.Sequential(*[b for k, b in encoder.blocks.items() if k.startswith('conv3_')])
-        self.conv4 = nn.Sequential(*[b for k, b in encoder.blocks.items() if k.startswith('conv4_')])
-        self.conv5 = nn.Sequential(*[b for k, b in encoder.blocks.items() if k.startswith('conv5_')])
+        self.conv3 = DualPathStage(*[b for k, b in encoder.blocks.items() if k.startswith('conv3_')])
+        self.conv4 = DualPathStage(*[b for k, b in encoder.blocks.items() if k.startswith('conv4_')])
+        self.conv5 = DualPathStage(*[b for k, b in encoder.blocks.items() if k.startswith('conv5_')])
 
     def forward(self, x):
         batch_size, C, H, W = x.shape
@@ -349,13 +349,13 @@ class Dpn92_Unet_Double(nn.Module):
                 encoder.blocks['conv1_1'].bn,  # bn
                 encoder.blocks['conv1_1'].act,  # relu
             )
-        self.conv2 = nn.Sequential(
+        self.conv2 = DualPathStage(
                 encoder.blocks['conv1_1'].pool,  # maxpool
                 *[b for k, b in encoder.blocks.items() if k.startswith('conv2_')]
             )
-        self.conv3 = nn.Sequential(*[b for k, b in encoder.blocks.items() if k.startswith('conv3_')])
-        self.conv4 = nn.Sequential(*[b for k, b in encoder.blocks.items() if k.startswith('conv4_')])
-        self.conv5 = nn.Sequential(*[b for k, b in encoder.blocks.items() if k.startswith('conv5_')])
+        self.conv3 = DualPathStage(*[b for k, b in encoder.blocks.items() if k.startswith('conv3_')])
+        self.conv4 = DualPathStage(*[b for k, b in encoder.blocks.items() if k.startswith('conv4_')])
+        self.conv5 = DualPathStage(*[b for k, b in encoder.blocks.items() if k.startswith('conv5_')])
 
 
     def forward1(self, x):